@@ -0,0 +1,81 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_chat_history(apps, schema_editor):
+    # Sessions used to hold the whole conversation as one JSON list
+    InterviewSession = apps.get_model("ai_interview", "InterviewSession")
+    InterviewTurn = apps.get_model("ai_interview", "InterviewTurn")
+    for session in InterviewSession.objects.iterator():
+        InterviewTurn.objects.bulk_create(
+            [
+                InterviewTurn(
+                    session=session, role=turn["role"], content=turn["content"]
+                )
+                for turn in session.chat_history
+                if turn.get("role") and turn.get("content") is not None
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai_interview", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="interviewsession",
+            name="mode",
+            field=models.CharField(
+                choices=[("factual", "Factual"), ("story", "Story")],
+                default="factual",
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="InterviewTurn",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("user", "User"), ("model", "Model")], max_length=10
+                    ),
+                ),
+                ("content", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="turns",
+                        to="ai_interview.interviewsession",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["session", "id"], name="ai_interview_turn_order"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_chat_history, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="interviewsession",
+            name="chat_history",
+        ),
+    ]
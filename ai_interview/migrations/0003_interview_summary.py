@@ -0,0 +1,23 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai_interview", "0002_interview_turns"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="interviewsession",
+            name="summarized_through",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="interviewsession",
+            name="summary",
+            field=models.TextField(blank=True),
+        ),
+    ]
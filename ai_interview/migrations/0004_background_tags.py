@@ -0,0 +1,36 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai_interview", "0003_interview_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="interviewturn",
+            name="extracted_data",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="interviewturn",
+            name="tags",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="interviewturn",
+            name="tags_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("pending", "Pending"),
+                    ("stored", "Stored"),
+                    ("failed", "Failed"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
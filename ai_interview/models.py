@@ -4,7 +4,42 @@ from django.contrib.auth.models import User
 class InterviewSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='interview_sessions')
     session_id = models.CharField(max_length=100, unique=True)
+    mode = models.CharField(max_length=20, choices=[('factual', 'Factual'), ('story', 'Story')], default='factual')
     started_at = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
     completed = models.BooleanField(default=False)
-    chat_history = models.JSONField(default=list)
\ No newline at end of file
+    # Running summary of every turn up to and including summarized_through (a turn id)
+    summary = models.TextField(blank=True)
+    summarized_through = models.BigIntegerField(default=0)
+
+    def history(self):
+        """The turns not yet folded into the summary as [{'role', 'content'}], oldest first."""
+        turns = self.turns.filter(id__gt=self.summarized_through).order_by('id')
+        return [{'role': role, 'content': content} for role, content in turns.values_list('role', 'content')]
+
+    def append(self, *turns):
+        """
+        Append (role, content) turns, or (role, content, tags) for a reply whose
+        tags are stored later in the background; returns the new turns. Earlier
+        turns are never rewritten.
+        """
+        created = InterviewTurn.objects.bulk_create([
+            InterviewTurn(session=self, role=turn[0], content=turn[1], tags=turn[2], tags_status='pending') if len(turn) > 2 and turn[2]
+            else InterviewTurn(session=self, role=turn[0], content=turn[1])
+            for turn in turns
+        ])
+        self.save(update_fields=['last_activity'])
+        return created
+
+class InterviewTurn(models.Model):
+    session = models.ForeignKey(InterviewSession, on_delete=models.CASCADE, related_name='turns')
+    role = models.CharField(max_length=10, choices=[('user', 'User'), ('model', 'Model')])
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Tags from a model reply waiting to be stored in the background, and what storing them produced
+    tags = models.JSONField(default=list, blank=True)
+    tags_status = models.CharField(max_length=10, choices=[('pending', 'Pending'), ('stored', 'Stored'), ('failed', 'Failed')], blank=True)
+    extracted_data = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['session', 'id'], name='ai_interview_turn_order')]
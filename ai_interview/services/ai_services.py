@@ -1,14 +1,86 @@
 import os
-import google.generativeai as genai
+import asyncio
+import threading
+import weakref
 from django.conf import settings
 
+from .history import estimate_tokens, fit_to_budget
+from .llm_backends import CachingBackend, GeminiBackend, RecordingBackend, ReplayBackend
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+PERSONAS = ('factual', 'story')
+
+_models = {}
+_models_lock = threading.Lock()
+_backend = None
+_upstream_slots = weakref.WeakKeyDictionary()
+
+
+def get_model(persona=None, model_name=GEMINI_MODEL):
+    """
+    Process-wide GenerativeModel for (model_name, persona), built on first use
+    so the client, its channel and auth are shared by every request. Persona
+    models carry their system prompt as system_instruction; persona=None is
+    the bare model used for one-off generation.
+    """
+    key = (model_name, persona)
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                import google.generativeai as genai
+                if not _models:
+                    api_key = getattr(settings, 'GEMINI_API_KEY', os.getenv('GEMINI_API_KEY'))
+                    if not api_key:
+                        raise ValueError("GEMINI_API_KEY not found in settings or environment")
+                    genai.configure(api_key=api_key)
+                system_instruction = QuestionaireService.get_persona_prompt(persona) if persona else None
+                _models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    return _models[key]
+
+
+def get_backend():
+    """
+    Process-wide LLM backend picked by settings.LLM_BACKEND: live Gemini
+    (recording to LLM_RECORD_FILE when set) or the offline replay of
+    LLM_REPLAY_FILE, behind the response cache.
+    """
+    global _backend
+    if _backend is None:
+        with _models_lock:
+            if _backend is None:
+                if settings.LLM_BACKEND == 'replay':
+                    inner = ReplayBackend(settings.LLM_REPLAY_FILE, settings.LLM_REPLAY_LATENCY)
+                else:
+                    inner = GeminiBackend(get_model, GEMINI_MODEL)
+                    if settings.LLM_RECORD_FILE: inner = RecordingBackend(inner, settings.LLM_RECORD_FILE)
+                _backend = CachingBackend(inner, settings.LLM_RESPONSE_CACHE_TTL)
+    return _backend
+
+
+def warm_up_models():
+    """Build the shared models and Gemini client at worker boot so the first chat turn does not pay for it."""
+    if settings.LLM_BACKEND != 'gemini': return
+    try:
+        for persona in (None,) + PERSONAS: get_model(persona)
+        from google.generativeai import client
+        client.get_default_generative_client()
+    except Exception as e:
+        print(f"Skipping Gemini warm-up: {e}")
+
+
+def upstream_slot():
+    """
+    Semaphore shared by every request on the running event loop, bounding its
+    in-flight Gemini calls. Under ASGI each worker process runs one loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _upstream_slots: _upstream_slots[loop] = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+    return _upstream_slots[loop]
+
+
 class QuestionaireService:
     def __init__(self, user_id=None):
-        api_key = getattr(settings, 'GEMINI_API_KEY', os.getenv('GEMINI_API_KEY'))
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in settings or environment")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.backend = get_backend()
 
     @staticmethod
     def get_system_prompt():
@@ -42,37 +114,89 @@ class QuestionaireService:
         [STORY:ancestor_name=Name, content=The full narrative text, context=Topic/Event]
         """
 
+    @classmethod
+    def get_persona_prompt(cls, mode):
+        return cls.get_story_system_prompt() if mode == 'story' else cls.get_system_prompt()
+
     def get_initial_message(self):
         return "Hail, traveler, and welcome to the digital hearth of Viking Roots! I am your guide, here to help you chart the great saga of your ancestors. To begin, what name do you go by?"
 
-    def build_chat_history(self, messages, system_prompt=None):
-        if system_prompt is None:
-            system_prompt = self.get_system_prompt()
-        history = [{'role': 'user', 'parts': [system_prompt]}]
+    def build_chat_history(self, messages, mode='factual', summary='', reserved_tokens=0):
+        """
+        Gemini history: the running summary, then as many of the latest messages
+        as fit in INTERVIEW_TOKEN_BUDGET next to the persona's system instruction.
+        """
+        budget = settings.INTERVIEW_TOKEN_BUDGET - estimate_tokens(self.get_persona_prompt(mode)) - reserved_tokens
+        history = []
+        if summary:
+            history.append({'role': 'user', 'parts': [f"Summary of this interview so far:\n{summary}"]})
+            history.append({'role': 'model', 'parts': ["Understood. Let's continue."]})
+            budget -= estimate_tokens(summary)
+        messages = fit_to_budget(messages, budget)
+        # Gemini expects turns to alternate from a user turn, also after the summary's model reply
+        while messages and messages[0]['role'] != 'user': messages = messages[1:]
         for msg in messages:
             history.append({'role': msg['role'], 'parts': [msg['content']]})
         return history
 
-    def get_response(self, chat_history, user_message, mode='factual'):
-        system_prompt = self.get_story_system_prompt() if mode == 'story' else self.get_system_prompt()
-        history = self.build_chat_history(chat_history, system_prompt)
-        chat = self.model.start_chat(history=history)
-        response = chat.send_message(user_message)
-        return {'message': response.text, 'extracted_data': None}
+    def get_response(self, chat_history, user_message, mode='factual', summary='', deterministic=False):
+        """deterministic=True lets the backend answer from its response cache, e.g. for story openers."""
+        persona = 'story' if mode == 'story' else 'factual'
+        history = self.build_chat_history(chat_history, persona, summary, estimate_tokens(user_message))
+        return {'message': self.backend.chat(persona, history, user_message, deterministic), 'extracted_data': None}
 
-    def generate_dynamic_prompts(self, heritage_summary):
+    async def get_response_async(self, chat_history, user_message, mode='factual', summary='', deterministic=False):
+        persona = 'story' if mode == 'story' else 'factual'
+        history = self.build_chat_history(chat_history, persona, summary, estimate_tokens(user_message))
+        async with upstream_slot():
+            message = await self.backend.chat_async(persona, history, user_message, deterministic)
+        return {'message': message, 'extracted_data': None}
+
+    async def stream_response_async(self, chat_history, user_message, mode='factual', summary=''):
+        """Yield the raw reply text chunk by chunk as the backend produces it; tags are left in."""
+        persona = 'story' if mode == 'story' else 'factual'
+        history = self.build_chat_history(chat_history, persona, summary, estimate_tokens(user_message))
+        async with upstream_slot():
+            async for chunk in self.backend.chat_stream_async(persona, history, user_message):
+                yield chunk
+
+    def summarize_history(self, summary, turns, extracted_data):
+        transcript = '\n'.join(f"{turn['role']}: {turn['content']}" for turn in turns)
         prompt = f"""
+        Condense this heritage interview so it can continue without the full transcript.
+        Keep every person's id, name and relation, all dates and places, and any questions still open.
+        Write plain prose of at most 250 words.
+        Summary so far: {summary or 'None'}
+        Already recorded: {extracted_data or 'Nothing yet'}
+        New transcript:
+        {transcript}
+        """
+        return self.backend.generate(prompt).strip()
+
+    @staticmethod
+    def get_dynamic_prompts_prompt(heritage_summary):
+        return f"""
         Based on this family heritage data: {heritage_summary}
         Generate 3 highly personalized, engaging story prompts for the user. 
         Focus on specific names, locations, or gaps.
         If no data is present, provide 3 general but evocative prompts about childhood, traditions, and family elders.
         Return ONLY a JSON list of 3 strings.
         """
-        response = self.model.generate_content(prompt)
+
+    def generate_dynamic_prompts(self, heritage_summary):
+        return self.parse_dynamic_prompts(self.backend.generate(self.get_dynamic_prompts_prompt(heritage_summary)))
+
+    async def generate_dynamic_prompts_async(self, heritage_summary):
+        async with upstream_slot():
+            text = await self.backend.generate_async(self.get_dynamic_prompts_prompt(heritage_summary))
+        return self.parse_dynamic_prompts(text)
+
+    @staticmethod
+    def parse_dynamic_prompts(text):
         try:
             import json
             # Clean up potential markdown formatting in response
-            clean_text = response.text.strip().replace('```json', '').replace('```', '')
+            clean_text = text.strip().replace('```json', '').replace('```', '')
             return json.loads(clean_text)
         except:
             return [
@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from heritage.models import Ancestor
+
+# Rough Gemini tokenisation for English prose; only used to stay under the budget
+CHARS_PER_TOKEN = 4
+MAX_SUMMARY_PEOPLE = 50
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def fit_to_budget(turns, budget):
+    """The newest turns whose combined size fits the token budget, oldest first. The latest turn is always kept."""
+    kept = []
+    for turn in reversed(turns):
+        budget -= estimate_tokens(turn['content'])
+        if budget < 0 and kept: break
+        kept.append(turn)
+    return kept[::-1]
+
+
+def extracted_data(user):
+    """The people, facts and events recorded from the interview so far, one line per person, for the summariser."""
+    people = (
+        Ancestor.objects.filter(user=user, source_type='ai_chat').order_by('id')
+        .prefetch_related('facts', 'events__event')[:MAX_SUMMARY_PEOPLE]
+    )
+    lines = []
+    for ancestor in people:
+        line = f"id={ancestor.unique_id}, name={ancestor.name}, relation={ancestor.relation}"
+        facts = [f"{fact.key}={fact.value}" for fact in ancestor.facts.all()]
+        events = [f"{p.event.title} ({p.event.date_start or 'undated'})" for p in ancestor.events.all()]
+        if facts: line += f"; facts: {', '.join(facts)}"
+        if events: line += f"; events: {', '.join(events)}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def queue_summary(session, pending):
+    """Fold older turns into the session summary in the background once `pending` unsummarised turns outgrow the window."""
+    if pending < settings.INTERVIEW_HISTORY_WINDOW + settings.INTERVIEW_SUMMARY_EVERY: return
+    try:
+        from ai_interview.tasks import summarize_interview
+        summarize_interview.delay(session.pk)
+    except Exception as e:
+        print(f"Error queuing interview summary task: {e}")
@@ -0,0 +1,179 @@
+"""
+Backends QuestionaireService talks to. Each answers chat turns for a persona
+('factual' or 'story') given a Gemini-style history, plus one-off
+generations, in sync and async forms; replies also stream asynchronously.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from django.core.cache import cache
+
+REPLAY_CHUNK_CHARS = 40
+FALLBACK_REPLIES = {
+    'chat:factual': "Thank you for sharing that. What else do you remember about your family?",
+    'chat:story': "What a remarkable memory. What happened next?",
+    'generate': json.dumps([
+        "What is your earliest childhood memory?",
+        "What traditions did your family keep?",
+        "Who was the storyteller in your family?",
+    ]),
+}
+
+
+def content_key(kind, history=None, message=''):
+    """Content address of a call: the same kind, history and message always map to the same key."""
+    return hashlib.sha256(json.dumps([kind, history or [], message], sort_keys=True).encode()).hexdigest()
+
+
+class GeminiBackend:
+    """Live Gemini calls through the process-wide models."""
+
+    def __init__(self, get_model, model_name):
+        self.get_model, self.name = get_model, model_name
+
+    def chat(self, persona, history, message):
+        return self.get_model(persona).start_chat(history=history).send_message(message).text
+
+    async def chat_stream_async(self, persona, history, message):
+        response = await self.get_model(persona).start_chat(history=history).send_message_async(message, stream=True)
+        async for chunk in response:
+            if chunk.text: yield chunk.text
+
+    async def chat_async(self, persona, history, message):
+        response = await self.get_model(persona).start_chat(history=history).send_message_async(message)
+        return response.text
+
+    def generate(self, prompt):
+        return self.get_model().generate_content(prompt).text
+
+    async def generate_async(self, prompt):
+        response = await self.get_model().generate_content_async(prompt)
+        return response.text
+
+
+class RecordingBackend:
+    """Passes calls through and appends each (key, response) to a JSON-lines file that ReplayBackend can load."""
+
+    def __init__(self, inner, path):
+        self.inner, self.path, self.name = inner, path, inner.name
+        self.lock = threading.Lock()
+
+    def record(self, kind, key, response):
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'kind': kind, 'key': key, 'response': response}) + '\n')
+        return response
+
+    def chat(self, persona, history, message):
+        return self.record(f"chat:{persona}", content_key(f"chat:{persona}", history, message), self.inner.chat(persona, history, message))
+
+    async def chat_stream_async(self, persona, history, message):
+        chunks = []
+        async for chunk in self.inner.chat_stream_async(persona, history, message):
+            chunks.append(chunk)
+            yield chunk
+        self.record(f"chat:{persona}", content_key(f"chat:{persona}", history, message), ''.join(chunks))
+
+    async def chat_async(self, persona, history, message):
+        response = await self.inner.chat_async(persona, history, message)
+        return self.record(f"chat:{persona}", content_key(f"chat:{persona}", history, message), response)
+
+    def generate(self, prompt):
+        return self.record('generate', content_key('generate', message=prompt), self.inner.generate(prompt))
+
+    async def generate_async(self, prompt):
+        return self.record('generate', content_key('generate', message=prompt), await self.inner.generate_async(prompt))
+
+
+class ReplayBackend:
+    """
+    Offline stand-in that answers from recorded responses, for development and
+    load tests without network access. Calls that were not recorded get the
+    recorded responses of the same kind in turn, or a canned reply. `latency`
+    seconds are added to every call to mimic the upstream.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path='', latency=0):
+        self.latency = latency
+        self.responses, self.by_kind = {}, defaultdict(list)
+        if path:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip(): continue
+                    record = json.loads(line)
+                    self.responses[record['key']] = record['response']
+                    self.by_kind[record['kind']].append(record['response'])
+        self.turn = itertools.count()
+
+    def reply(self, kind, key):
+        if key in self.responses: return self.responses[key]
+        options = self.by_kind.get(kind)
+        if options: return options[next(self.turn) % len(options)]
+        return FALLBACK_REPLIES.get(kind, FALLBACK_REPLIES['chat:factual'])
+
+    def chat(self, persona, history, message):
+        time.sleep(self.latency)
+        return self.reply(f"chat:{persona}", content_key(f"chat:{persona}", history, message))
+
+    async def chat_stream_async(self, persona, history, message):
+        text = await self.chat_async(persona, history, message)
+        for i in range(0, len(text), REPLAY_CHUNK_CHARS): yield text[i:i + REPLAY_CHUNK_CHARS]
+
+    async def chat_async(self, persona, history, message):
+        await asyncio.sleep(self.latency)
+        return self.reply(f"chat:{persona}", content_key(f"chat:{persona}", history, message))
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        return self.reply('generate', content_key('generate', message=prompt))
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self.reply('generate', content_key('generate', message=prompt))
+
+
+class CachingBackend:
+    """
+    Response cache in front of another backend. Only chat turns marked
+    deterministic, such as a story opener for a given prompt, are cached, in
+    the Django cache under their content address; everything else passes
+    straight through.
+    """
+
+    def __init__(self, inner, ttl):
+        self.inner, self.ttl, self.name = inner, ttl, inner.name
+
+    def cache_key(self, persona, history, message):
+        return f"llm:{self.name}:{content_key(f'chat:{persona}', history, message)}"
+
+    def chat(self, persona, history, message, deterministic=False):
+        if not deterministic: return self.inner.chat(persona, history, message)
+        key = self.cache_key(persona, history, message)
+        response = cache.get(key)
+        if response is None:
+            response = self.inner.chat(persona, history, message)
+            cache.set(key, response, self.ttl)
+        return response
+
+    def chat_stream_async(self, persona, history, message):
+        return self.inner.chat_stream_async(persona, history, message)
+
+    async def chat_async(self, persona, history, message, deterministic=False):
+        if not deterministic: return await self.inner.chat_async(persona, history, message)
+        key = self.cache_key(persona, history, message)
+        response = await cache.aget(key)
+        if response is None:
+            response = await self.inner.chat_async(persona, history, message)
+            await cache.aset(key, response, self.ttl)
+        return response
+
+    def generate(self, prompt):
+        return self.inner.generate(prompt)
+
+    async def generate_async(self, prompt):
+        return await self.inner.generate_async(prompt)
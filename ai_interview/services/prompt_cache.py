@@ -0,0 +1,50 @@
+import json
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from heritage.services.digest import heritage_digest
+
+# How long a queued refresh holds off further ones for the same user
+REFRESH_LOCK_SECONDS = 120
+
+
+def prompts_key(user_id):
+    return f"dynamic_prompts:{user_id}"
+
+
+def cached_dynamic_prompts(user_id, data_version):
+    """
+    Cached story prompts for the user, or None if they must be generated now.
+    Prompts made from an older data_version are still returned while a
+    background refresh replaces them.
+    """
+    entry = cache.get(prompts_key(user_id))
+    if entry is None: return None
+    if entry['version'] == data_version: return entry['prompts']
+    # A per-process cache never sees what a Celery worker writes back
+    if isinstance(caches['default'], LocMemCache): return None
+
+    lock = f"{prompts_key(user_id)}:refreshing"
+    if cache.add(lock, True, REFRESH_LOCK_SECONDS):
+        try:
+            from ai_interview.tasks import refresh_dynamic_prompts
+            refresh_dynamic_prompts.delay(user_id)
+        except Exception as e:
+            print(f"Error queuing prompt refresh task: {e}")
+            cache.delete(lock)
+            return None
+    return entry['prompts']
+
+
+def store_dynamic_prompts(user_id, data_version, prompts):
+    cache.set(prompts_key(user_id), {'version': data_version, 'prompts': prompts}, settings.DYNAMIC_PROMPTS_CACHE_TTL)
+    cache.delete(f"{prompts_key(user_id)}:refreshing")
+
+
+def build_dynamic_prompts(storage, service):
+    """Generate prompts from the user's heritage digest and cache them against the data_version they were built from."""
+    version = storage.profile.data_version
+    prompts = service.generate_dynamic_prompts(json.dumps(heritage_digest(storage.profile)))
+    store_dynamic_prompts(storage.user.id, version, prompts)
+    return prompts
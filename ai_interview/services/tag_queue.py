@@ -0,0 +1,8 @@
+def queue_tag_persistence(session):
+    """Store the session's pending reply tags in the background, or right away if no worker can be reached."""
+    from ai_interview.tasks import persist_interview_tags
+    try:
+        persist_interview_tags.delay(session.pk)
+    except Exception as e:
+        print(f"Error queuing tag persistence task: {e}")
+        persist_interview_tags(session.pk)
@@ -0,0 +1,74 @@
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from heritage.services.db_storage import DatabaseStorageService
+from heritage.services.tag_extraction import TagWriter
+from .models import InterviewSession
+from .services.ai_services import QuestionaireService
+from .services.history import extracted_data
+from .services.prompt_cache import build_dynamic_prompts
+
+
+@shared_task
+def summarize_interview(session_pk):
+    """
+    Background task to fold every turn older than the rolling window into the
+    session's running summary, together with the data already extracted.
+    """
+    try:
+        session = InterviewSession.objects.select_related('user').get(pk=session_pk)
+    except InterviewSession.DoesNotExist:
+        return f"Interview session {session_pk} not found"
+
+    turns = list(session.turns.filter(id__gt=session.summarized_through).order_by('id'))
+    folded = turns[:-settings.INTERVIEW_HISTORY_WINDOW]
+    if len(folded) < settings.INTERVIEW_SUMMARY_EVERY:
+        return f"Nothing to summarize for session {session_pk}"
+
+    summary = QuestionaireService().summarize_history(
+        session.summary, [{'role': t.role, 'content': t.content} for t in folded], extracted_data(session.user)
+    )
+    # Only the first of two overlapping runs gets to advance the summary
+    updated = InterviewSession.objects.filter(pk=session.pk, summarized_through=session.summarized_through).update(
+        summary=summary, summarized_through=folded[-1].id
+    )
+    return f"Summarized {len(folded)} turns for session {session_pk}" if updated else f"Session {session_pk} was already summarized"
+
+
+@shared_task
+def refresh_dynamic_prompts(user_id):
+    """Background task to regenerate a user's cached story prompts after their heritage data changed."""
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+    prompts = build_dynamic_prompts(DatabaseStorageService(user), QuestionaireService())
+    return f"Refreshed {len(prompts)} story prompts for user {user_id}"
+
+
+@shared_task
+def persist_interview_tags(session_pk):
+    """
+    Background task to store the tags of a session's pending replies, oldest
+    first. Runs hold the session row lock, so one session's turns are stored
+    in order and a repeated run finds nothing left to do.
+    """
+    with transaction.atomic():
+        session = InterviewSession.objects.select_for_update().select_related('user').filter(pk=session_pk).first()
+        if session is None:
+            return f"Interview session {session_pk} not found"
+        storage = DatabaseStorageService(session.user)
+        pending = list(session.turns.filter(tags_status='pending').order_by('id'))
+        for turn in pending:
+            try:
+                with transaction.atomic():
+                    turn.extracted_data = TagWriter(session.user, storage.profile).write(turn.tags)
+                    turn.tags_status = 'stored'
+                    turn.save(update_fields=['extracted_data', 'tags_status'])
+            except Exception as e:
+                print(f"Error storing tags for interview turn {turn.id}: {e}")
+                turn.tags_status = 'failed'
+                turn.save(update_fields=['tags_status'])
+    return f"Stored tags for {len(pending)} turns of session {session_pk}"
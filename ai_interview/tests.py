@@ -1,3 +1,53 @@
-from django.test import TestCase
+import asyncio
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .models import InterviewSession
+from .services import ai_services
+from .services.ai_services import upstream_slot
+from .services.llm_backends import CachingBackend, ReplayBackend
+
+
+class UpstreamSlotTests(SimpleTestCase):
+    def test_one_semaphore_per_event_loop(self):
+        async def slots():
+            return upstream_slot(), upstream_slot()
+
+        first, again = asyncio.run(slots())
+        other, _ = asyncio.run(slots())
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+
+class StreamReplyTests(TestCase):
+    REPLY = "Hail, Ingrid! [DATA:key=first_name, value=Ingrid] Tell me about your grandmother."
+
+    def setUp(self):
+        replay = ReplayBackend()
+        replay.by_kind['chat:factual'] = [self.REPLY]
+        patcher = mock.patch.object(ai_services, '_backend', CachingBackend(replay, 0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_reply_streams_from_an_async_iterator_without_its_tags(self):
+        response = await self.async_client.post(
+            '/api/ai_interview/message/stream/', {'message': 'I am Ingrid', 'session_id': 's1'}, content_type='application/json'
+        )
+        self.assertTrue(response.is_async)
+
+        events = [event async for event in response.streaming_content]
+        parsed = [
+            (lines[0].removeprefix('event: '), json.loads(lines[1].removeprefix('data: ')))
+            for lines in (event.decode().strip().split('\n') for event in events)
+        ]
+
+        self.assertEqual({name for name, _ in parsed[:-1]}, {'chunk'})
+        self.assertEqual(parsed[-1][0], 'done')
+        text = ''.join(payload['text'] for _, payload in parsed[:-1])
+        self.assertEqual(text, "Hail, Ingrid!  Tell me about your grandmother.")
+        self.assertEqual(parsed[-1][1]['extracted_data']['user_data'], [{'first_name': 'Ingrid'}])
+        session = await InterviewSession.objects.aget(session_id='s1')
+        self.assertEqual(await session.turns.acount(), 2)
@@ -7,10 +7,18 @@ urlpatterns = [
     # Main Interview Flow
     path('start/', views.start_interview, name='start_interview'),
     path('message/', views.send_message, name='send_message'),
+    path('message/stream/', views.send_message_stream, name='send_message_stream'),
+    path('extraction/<int:turn_id>/', views.get_extraction, name='get_extraction'),
     path('complete/', views.complete_interview, name='complete_interview'),
     
     # Dynamic Story Prompts & Story Interviews
     path('story/prompts/', views.get_dynamic_prompts, name='get_story_prompts'),
     path('story/start/', views.start_story_interview, name='start_story_interview'),
     path('story/message/', views.send_story_message, name='send_story_message'),
+    path('story/message/stream/', views.send_story_message_stream, name='send_story_message_stream'),
+    
+    # Async (ASGI) variants
+    path('async/message/', views.send_message_async, name='send_message_async'),
+    path('async/story/prompts/', views.get_dynamic_prompts_async, name='get_story_prompts_async'),
+    path('async/story/message/', views.send_story_message_async, name='send_story_message_async'),
 ]
\ No newline at end of file
@@ -1,16 +1,24 @@
 import json
 import uuid
 import traceback
-from django.http import JsonResponse
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.conf import settings
 from django.contrib.auth.models import User
 
 # Import AI Service from THIS app
+from .models import InterviewSession, InterviewTurn
 from .services.ai_services import QuestionaireService
+from .services.history import queue_summary
+from .services.prompt_cache import build_dynamic_prompts, cached_dynamic_prompts, store_dynamic_prompts
+from .services.tag_queue import queue_tag_persistence
 
 # IMPORT DATABASE STORAGE FROM THE CORE HERITAGE APP
 from heritage.services.db_storage import DatabaseStorageService
+from heritage.services.digest import heritage_digest
+from heritage.services.tag_extraction import TagStreamFilter, extract_tags
 
 def get_or_create_session_id(request):
     """Get or create a unique session ID"""
@@ -26,6 +34,60 @@ def get_user_for_request(request):
         user, _ = User.objects.get_or_create(username='testuser')
         return user
 
+def record_reply(storage, session, history, user_message, reply):
+    """
+    Append the turn and store the tags from the AI reply; returns the response
+    payload. With INTERVIEW_BACKGROUND_TAGS the tags are only queued, and the
+    client polls extraction/<turn_id>/ for the extracted data.
+    """
+    if settings.INTERVIEW_BACKGROUND_TAGS:
+        cleaned_text, tags = extract_tags(reply)
+        _, turn = session.append(('user', user_message), ('model', cleaned_text, tags))
+        extracted_data = None
+        if tags: queue_tag_persistence(session)
+    else:
+        cleaned_text, extracted_data = storage.extract_and_store_tags(reply)
+        _, turn = session.append(('user', user_message), ('model', cleaned_text))
+    queue_summary(session, len(history) + 2)
+    return {
+        'message': cleaned_text,
+        'extracted_data': extracted_data,
+        'turn_id': turn.id,
+        'extraction': turn.tags_status or 'stored'
+    }
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_reply(storage, session, user_message, mode='factual'):
+    """
+    Server-Sent Events response relaying the AI reply as it is generated.
+    Tags are held back from the 'chunk' events; once the reply is complete
+    they are extracted and stored, and a 'done' event carries the cleaned
+    message and extracted data. The events come from an async generator, which
+    Django streams under ASGI rather than buffering the whole reply.
+    """
+    async def events():
+        try:
+            history = await sync_to_async(session.history)()
+            raw, tags = [], TagStreamFilter()
+            async for chunk in QuestionaireService().stream_response_async(history, user_message, mode=mode, summary=session.summary):
+                raw.append(chunk)
+                text = tags.feed(chunk)
+                if text: yield sse_event('chunk', {'text': text})
+            text = tags.flush()
+            if text: yield sse_event('chunk', {'text': text})
+            
+            yield sse_event('done', await sync_to_async(record_reply)(storage, session, history, user_message, ''.join(raw)))
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event('error', {'error': str(e)})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
 @csrf_exempt
 def start_interview(request):
     """Get the initial welcome message"""
@@ -40,6 +102,10 @@ def start_interview(request):
             storage.profile.interview_started_at = timezone.now()
             storage.profile.save()
             
+            session = storage.get_interview_session(session_id)
+            if not session.turns.exists():
+                session.append(('model', initial_message))
+            
             return JsonResponse({
                 'message': initial_message,
                 'session_id': session_id
@@ -57,30 +123,19 @@ def send_message(request):
         try:
             data = json.loads(request.body)
             user_message = data.get('message', '').strip()
-            chat_history = data.get('chat_history', [])
             
             if not user_message:
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
             
             user = get_user_for_request(request)
-            
-            service = QuestionaireService()
-            ai_response = service.get_response(chat_history, user_message)
-            
             storage = DatabaseStorageService(user)
-            cleaned_text, extracted_data = storage.extract_and_store_tags(ai_response['message'])
+            session = storage.get_interview_session(data.get('session_id') or get_or_create_session_id(request))
             
-            session_id = get_or_create_session_id(request)
-            updated_history = chat_history + [
-                {'role': 'user', 'content': user_message},
-                {'role': 'model', 'content': cleaned_text}
-            ]
-            storage.save_interview_session(session_id, updated_history)
+            history = session.history()
+            service = QuestionaireService()
+            ai_response = service.get_response(history, user_message, summary=session.summary)
             
-            return JsonResponse({
-                'message': cleaned_text,
-                'extracted_data': extracted_data
-            }, status=200)
+            return JsonResponse(record_reply(storage, session, history, user_message, ai_response['message']), status=200)
             
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
@@ -114,6 +169,29 @@ def complete_interview(request):
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
+@csrf_exempt
+def send_message_stream(request):
+    """Streaming variant of send_message, answered as Server-Sent Events"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            
+            if not user_message:
+                return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+            
+            user = get_user_for_request(request)
+            storage = DatabaseStorageService(user)
+            session = storage.get_interview_session(data.get('session_id') or get_or_create_session_id(request))
+            return stream_reply(storage, session, user_message)
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
 # =============================================================================
 # Dynamic Story Prompts & Interviews
 # =============================================================================
@@ -125,10 +203,10 @@ def get_dynamic_prompts(request):
         try:
             user = get_user_for_request(request)
             storage = DatabaseStorageService(user)
-            heritage_data = storage.get_all_heritage_data()
             
-            service = QuestionaireService()
-            prompts = service.generate_dynamic_prompts(heritage_data)
+            prompts = cached_dynamic_prompts(user.id, storage.profile.data_version)
+            if prompts is None:
+                prompts = build_dynamic_prompts(storage, QuestionaireService())
             
             return JsonResponse({'prompts': prompts}, status=200)
         except Exception as e:
@@ -150,11 +228,15 @@ def start_story_interview(request):
             service = QuestionaireService()
             
             # Use Keeper of Tales persona to respond to the prompt
-            ai_response = service.get_response([], f"User has chosen this prompt: '{prompt}'. Start the interview.", mode='story')
+            opening = f"User has chosen this prompt: '{prompt}'. Start the interview."
+            ai_response = service.get_response([], opening, mode='story', deterministic=True)
+            
+            session = DatabaseStorageService(user).get_interview_session(str(uuid.uuid4()), mode='story')
+            session.append(('user', opening), ('model', ai_response['message']))
             
             return JsonResponse({
                 'message': ai_response['message'],
-                'session_id': str(uuid.uuid4())
+                'session_id': session.session_id
             }, status=200)
         except Exception as e:
             traceback.print_exc()
@@ -168,20 +250,143 @@ def send_story_message(request):
         try:
             data = json.loads(request.body)
             user_message = data.get('message', '').strip()
-            chat_history = data.get('chat_history', [])
             
             user = get_user_for_request(request)
+            session = InterviewSession.objects.filter(user=user, session_id=data.get('session_id'), mode='story').first()
+            if session is None:
+                return JsonResponse({'error': 'Story session not found'}, status=404)
+            
+            history = session.history()
             service = QuestionaireService()
-            ai_response = service.get_response(chat_history, user_message, mode='story')
+            ai_response = service.get_response(history, user_message, mode='story', summary=session.summary)
             
             storage = DatabaseStorageService(user)
-            cleaned_text, extracted_data = storage.extract_and_store_tags(ai_response['message'])
+            return JsonResponse(record_reply(storage, session, history, user_message, ai_response['message']), status=200)
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def send_story_message_stream(request):
+    """Streaming variant of send_story_message, answered as Server-Sent Events"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            
+            user = get_user_for_request(request)
+            session = InterviewSession.objects.filter(user=user, session_id=data.get('session_id'), mode='story').first()
+            if session is None:
+                return JsonResponse({'error': 'Story session not found'}, status=404)
+            
+            return stream_reply(DatabaseStorageService(user), session, user_message, mode='story')
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def get_extraction(request, turn_id):
+    """Poll what was extracted from an AI reply whose tags are stored in the background"""
+    if request.method == 'GET':
+        try:
+            user = get_user_for_request(request)
+            turn = InterviewTurn.objects.filter(id=turn_id, session__user=user, role='model').first()
+            if turn is None:
+                return JsonResponse({'error': 'Turn not found'}, status=404)
             
             return JsonResponse({
-                'message': cleaned_text,
-                'extracted_data': extracted_data
+                'turn_id': turn.id,
+                'extraction': turn.tags_status or 'stored',
+                'extracted_data': turn.extracted_data
             }, status=200)
         except Exception as e:
             traceback.print_exc()
             return JsonResponse({'error': str(e)}, status=500)
-    return JsonResponse({'error': 'Invalid request method'}, status=405)
\ No newline at end of file
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# =============================================================================
+# Async (ASGI) variants: the Gemini round trip awaits instead of holding a worker
+# =============================================================================
+
+def async_csrf_exempt(view):
+    """csrf_exempt for async views; Django 4.2's wrapper would otherwise hide that they are coroutines."""
+    return markcoroutinefunction(csrf_exempt(view))
+
+def load_interview(request, data):
+    """(storage, session, unsummarised history) for the caller's interview session"""
+    storage = DatabaseStorageService(get_user_for_request(request))
+    session = storage.get_interview_session(data.get('session_id') or get_or_create_session_id(request))
+    return storage, session, session.history()
+
+def load_story_interview(request, data):
+    """(storage, session, unsummarised history) for the caller's story session; session is None if unknown"""
+    user = get_user_for_request(request)
+    session = InterviewSession.objects.filter(user=user, session_id=data.get('session_id'), mode='story').first()
+    return DatabaseStorageService(user), session, session.history() if session else []
+
+def load_dynamic_prompts(request):
+    """(storage, cached prompts or None, heritage digest to generate from on a miss)"""
+    storage = DatabaseStorageService(get_user_for_request(request))
+    prompts = cached_dynamic_prompts(storage.user.id, storage.profile.data_version)
+    return storage, prompts, json.dumps(heritage_digest(storage.profile)) if prompts is None else None
+
+@async_csrf_exempt
+async def send_message_async(request):
+    """Async variant of send_message"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            
+            if not user_message:
+                return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+            
+            storage, session, history = await sync_to_async(load_interview)(request, data)
+            ai_response = await QuestionaireService().get_response_async(history, user_message, summary=session.summary)
+            payload = await sync_to_async(record_reply)(storage, session, history, user_message, ai_response['message'])
+            return JsonResponse(payload, status=200)
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+@async_csrf_exempt
+async def send_story_message_async(request):
+    """Async variant of send_story_message"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            
+            storage, session, history = await sync_to_async(load_story_interview)(request, data)
+            if session is None:
+                return JsonResponse({'error': 'Story session not found'}, status=404)
+            
+            ai_response = await QuestionaireService().get_response_async(history, user_message, mode='story', summary=session.summary)
+            payload = await sync_to_async(record_reply)(storage, session, history, user_message, ai_response['message'])
+            return JsonResponse(payload, status=200)
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+@async_csrf_exempt
+async def get_dynamic_prompts_async(request):
+    """Async variant of get_dynamic_prompts"""
+    if request.method == 'GET':
+        try:
+            storage, prompts, heritage_data = await sync_to_async(load_dynamic_prompts)(request)
+            if prompts is None:
+                prompts = await QuestionaireService().generate_dynamic_prompts_async(heritage_data)
+                await sync_to_async(store_dynamic_prompts)(storage.user.id, storage.profile.data_version, prompts)
+            
+            return JsonResponse({'prompts': prompts}, status=200)
+        except Exception as e:
+            traceback.print_exc()
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
@@ -15,6 +16,12 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+@worker_process_init.connect
+def warm_up_gemini(**kwargs):
+    # Each worker process builds its own Gemini client after the fork
+    from ai_interview.services.ai_services import warm_up_models
+    warm_up_models()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -51,7 +51,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be before CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "api.middleware.AsyncWhiteNoiseMiddleware",
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -212,6 +212,53 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# GEDCOM imports use the default queue unless GEDCOM_IMPORT_QUEUE names one; only
+# route them away once a solo-pool worker consumes it, since that worker's process
+# may start the parsing pool (prefork children are daemonic and cannot):
+#   celery -A api worker -Q gedcom_import --pool=solo
+GEDCOM_IMPORT_QUEUE = os.getenv('GEDCOM_IMPORT_QUEUE', '')
+if GEDCOM_IMPORT_QUEUE:
+    CELERY_TASK_ROUTES = {'heritage.tasks.import_gedcom_batch': {'queue': GEDCOM_IMPORT_QUEUE}}
+
+# Processes used to parse GEDCOM uploads in parallel (0/1 = parse in the importing process)
+GEDCOM_IMPORT_WORKERS = int(os.getenv('GEDCOM_IMPORT_WORKERS', '0'))
+
+# Interview history sent to Gemini: the latest turns verbatim, older ones folded into a running summary
+INTERVIEW_HISTORY_WINDOW = int(os.getenv('INTERVIEW_HISTORY_WINDOW', '12'))
+INTERVIEW_SUMMARY_EVERY = int(os.getenv('INTERVIEW_SUMMARY_EVERY', '8'))
+INTERVIEW_TOKEN_BUDGET = int(os.getenv('INTERVIEW_TOKEN_BUDGET', '8000'))
+
+# Gemini calls each ASGI worker's event loop may have in flight at once from the async and streaming interview views
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '64'))
+
+# Reply with the cleaned text straight away and store the extracted tags in a Celery task
+INTERVIEW_BACKGROUND_TAGS = os.getenv('INTERVIEW_BACKGROUND_TAGS', 'False') == 'True'
+
+# LLM backend for the interview: 'gemini', or 'replay' to answer offline from LLM_REPLAY_FILE
+# (a JSON-lines file the gemini backend writes when LLM_RECORD_FILE is set)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+LLM_RECORD_FILE = os.getenv('LLM_RECORD_FILE', '')
+LLM_REPLAY_FILE = os.getenv('LLM_REPLAY_FILE', '')
+LLM_REPLAY_LATENCY = float(os.getenv('LLM_REPLAY_LATENCY', '0'))
+# How long cached deterministic replies (such as story openers) are kept
+LLM_RESPONSE_CACHE_TTL = int(os.getenv('LLM_RESPONSE_CACHE_TTL', 30 * 24 * 60 * 60))
+
+# Cache: Redis (shared with the Celery workers) when REDIS_URL is set, else per-process memory.
+# Every entry is written with a timeout, so old prompt keys expire on their own. Locmem also
+# evicts when MAX_ENTRIES is reached; Redis only evicts under memory pressure with maxmemory
+# and an LRU maxmemory-policy set (the default, noeviction, fails writes instead). Use
+# volatile-lru rather than allkeys-lru, since the Celery broker queues live in the same Redis.
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 5000}}}
+
+# How long generated story prompts are kept; they are refreshed sooner when the user's heritage data changes
+DYNAMIC_PROMPTS_CACHE_TTL = int(os.getenv('DYNAMIC_PROMPTS_CACHE_TTL', 7 * 24 * 60 * 60))
+
+# Longest a merged family tree snapshot is served for, even while no member's data changed,
+# so the signed media URLs inside it stay valid
+MERGED_TREE_SNAPSHOT_MAX_AGE = int(os.getenv('MERGED_TREE_SNAPSHOT_MAX_AGE', 30 * 60))
 
 # Storage configuration based on environment
 if DEBUG:
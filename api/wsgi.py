@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 
 app = get_wsgi_application()
+
+# Build the shared Gemini models once per worker, before the first request
+from ai_interview.services.ai_services import warm_up_models  # noqa: E402
+warm_up_models()
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:45
+
+import re
+import unicodedata
+
+import jellyfish
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of the blocking keys as of this migration, so later changes to
+# the service do not change what it backfills
+TRANSLITERATIONS = str.maketrans({"ð": "d", "þ": "th", "æ": "ae", "ø": "o", "ß": "ss"})
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+
+def name_block_keys(name):
+    if not name:
+        return set()
+    text = name.lower().translate(TRANSLITERATIONS)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    tokens = TOKEN_PATTERN.findall(text)
+    if not tokens:
+        return set()
+    first, last = tokens[0], tokens[-1]
+    if first == last:
+        return {f"sn:{last}", f"mp:{jellyfish.metaphone(last)}"}
+    return {
+        f"sn:{last}",
+        f"mp:{jellyfish.metaphone(last)}:{first[0]}",
+        f"ny:{jellyfish.nysiis(first)}:{last[0]}",
+        f"sx:{jellyfish.soundex(first)}{jellyfish.soundex(last)}",
+    }
+
+
+def birth_decade(birth_year):
+    return birth_year // 10 if birth_year else None
+
+
+def backfill_block_keys(apps, schema_editor):
+    Ancestor = apps.get_model("heritage", "Ancestor")
+    AncestorBlockKey = apps.get_model("community", "AncestorBlockKey")
+    rows = []
+    for ancestor in Ancestor.objects.only("id", "name", "birth_year").iterator(
+        chunk_size=2000
+    ):
+        decade = birth_decade(ancestor.birth_year)
+        rows.extend(
+            AncestorBlockKey(ancestor_id=ancestor.id, key=key, birth_decade=decade)
+            for key in name_block_keys(ancestor.name)
+        )
+        if len(rows) >= 5000:
+            AncestorBlockKey.objects.bulk_create(rows)
+            rows = []
+    AncestorBlockKey.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0001_initial"),
+        ("community", "0002_group_post_grouppost_comment_postlike_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AncestorBlockKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64)),
+                ("birth_decade", models.IntegerField(blank=True, null=True)),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="block_keys",
+                        to="heritage.ancestor",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["key", "birth_decade"], name="community_blockkey_lookup"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_block_keys, migrations.RunPython.noop),
+    ]
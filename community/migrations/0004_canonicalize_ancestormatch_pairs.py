@@ -0,0 +1,42 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:48
+
+from django.db import migrations
+
+STATUS_RANK = {"confirmed": 0, "rejected": 1, "suggested": 2}
+
+
+def canonicalize_matches(apps, schema_editor):
+    """Store each pair lower-id-first and keep one row per pair, preferring reviewed ones."""
+    AncestorMatch = apps.get_model("community", "AncestorMatch")
+    keep, drop = {}, []
+    for match in AncestorMatch.objects.order_by("id"):
+        if match.ancestor1_id == match.ancestor2_id:
+            drop.append(match.id)
+            continue
+        pair = tuple(sorted((match.ancestor1_id, match.ancestor2_id)))
+        current = keep.get(pair)
+        if current is None or STATUS_RANK.get(match.status, 3) < STATUS_RANK.get(
+            current.status, 3
+        ):
+            if current is not None:
+                drop.append(current.id)
+            keep[pair] = match
+        else:
+            drop.append(match.id)
+    AncestorMatch.objects.filter(id__in=drop).delete()
+    for pair, match in keep.items():
+        if (match.ancestor1_id, match.ancestor2_id) != pair:
+            AncestorMatch.objects.filter(id=match.id).update(
+                ancestor1_id=pair[0], ancestor2_id=pair[1]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0003_ancestorblockkey"),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_matches, migrations.RunPython.noop),
+    ]
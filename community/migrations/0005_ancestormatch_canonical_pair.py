@@ -0,0 +1,26 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0004_canonicalize_ancestormatch_pairs"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="ancestormatch",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor1", "ancestor2"), name="unique_ancestor_match_pair"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ancestormatch",
+            constraint=models.CheckConstraint(
+                check=models.Q(("ancestor1__lt", models.F("ancestor2"))),
+                name="ancestor_match_canonical_order",
+            ),
+        ),
+    ]
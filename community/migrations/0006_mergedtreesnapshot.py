@@ -0,0 +1,32 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0005_ancestormatch_canonical_pair"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MergedTreeSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("members_key", models.CharField(max_length=64, unique=True)),
+                ("member_ids", models.JSONField(default=list)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("data", models.BinaryField()),
+                ("built_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:45
+
+import re
+import unicodedata
+
+import jellyfish
+from django.db import migrations
+
+# Frozen copy of the name normalisation as of this migration
+TRANSLITERATIONS = str.maketrans({"ð": "d", "þ": "th", "æ": "ae", "ø": "o", "ß": "ss"})
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+
+def given_name_key(name):
+    if not name:
+        return None
+    text = name.lower().translate(TRANSLITERATIONS)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    tokens = TOKEN_PATTERN.findall(text)
+    return f"gn:{jellyfish.metaphone(tokens[0])}" if tokens else None
+
+
+def add_given_name_keys(apps, schema_editor):
+    Ancestor = apps.get_model("heritage", "Ancestor")
+    AncestorBlockKey = apps.get_model("community", "AncestorBlockKey")
+    rows = []
+    # Ancestors saved since the new code deployed already have one
+    indexed = AncestorBlockKey.objects.filter(key__startswith="gn:").values(
+        "ancestor_id"
+    )
+    for ancestor in (
+        Ancestor.objects.exclude(id__in=indexed)
+        .only("id", "name", "birth_year")
+        .iterator(chunk_size=2000)
+    ):
+        key = given_name_key(ancestor.name)
+        if key is None:
+            continue
+        decade = ancestor.birth_year // 10 if ancestor.birth_year else None
+        rows.append(
+            AncestorBlockKey(ancestor_id=ancestor.id, key=key, birth_decade=decade)
+        )
+        if len(rows) >= 5000:
+            AncestorBlockKey.objects.bulk_create(rows)
+            rows = []
+    AncestorBlockKey.objects.bulk_create(rows)
+
+
+def remove_given_name_keys(apps, schema_editor):
+    AncestorBlockKey = apps.get_model("community", "AncestorBlockKey")
+    AncestorBlockKey.objects.filter(key__startswith="gn:").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0001_initial"),
+        ("community", "0006_mergedtreesnapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_given_name_keys, remove_given_name_keys),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from heritage.models import Ancestor
+import json
 import uuid
+import zlib
 
 
 class FamilyConnection(models.Model):
@@ -20,11 +22,46 @@ class AncestorMatch(models.Model):
     status = models.CharField(max_length=20, choices=[('suggested', 'Suggested'), ('confirmed', 'Confirmed'), ('rejected', 'Rejected')], default='suggested')
     reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        # Pairs are stored canonically (lower ancestor id first) so each pair has one row
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor1', 'ancestor2'], name='unique_ancestor_match_pair'),
+            models.CheckConstraint(check=models.Q(ancestor1__lt=models.F('ancestor2')), name='ancestor_match_canonical_order'),
+        ]
+
+    @staticmethod
+    def canonical_pair(ancestor_id1, ancestor_id2):
+        return (ancestor_id1, ancestor_id2) if ancestor_id1 < ancestor_id2 else (ancestor_id2, ancestor_id1)
+
 class MergedFamilyTree(models.Model):
     name = models.CharField(max_length=200)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_trees')
     members = models.ManyToManyField(User, related_name='family_trees')
 
+class MergedTreeSnapshot(models.Model):
+    """Compressed merged-tree payload for a member set, valid while the members' data versions are unchanged."""
+    members_key = models.CharField(max_length=64, unique=True)
+    member_ids = models.JSONField(default=list)
+    version = models.PositiveBigIntegerField(default=0)
+    data = models.BinaryField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    def get_tree(self):
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+    @staticmethod
+    def compress_tree(tree):
+        return zlib.compress(json.dumps(tree, separators=(',', ':')).encode('utf-8'))
+
+class AncestorBlockKey(models.Model):
+    """Phonetic/normalized name key used to block match candidates before scoring."""
+    ancestor = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='block_keys')
+    key = models.CharField(max_length=64)
+    birth_decade = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['key', 'birth_decade'], name='community_blockkey_lookup')]
+
 
 # =============================================================================
 # Social Media & Group Models
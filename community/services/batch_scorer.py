@@ -0,0 +1,66 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+import jellyfish
+
+
+def normalize(name):
+    return name.lower().strip() if name else ''
+
+
+class BatchNameScorer:
+    """
+    Scores many names against many candidates in one pass.
+
+    Produces the same score as FamilyMatchingService.name_similarity
+    (max of Jaro-Winkler and SequenceMatcher ratio) but works over unique
+    normalized names only, reuses one SequenceMatcher per candidate name
+    (its seq2 index is built once per column) and skips the full ratio when
+    SequenceMatcher's cheap upper bounds show it cannot change the result.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._cache = {}
+
+    def similarity(self, name1, name2):
+        name1, name2 = normalize(name1), normalize(name2)
+        key = (name1, name2)
+        if key not in self._cache:
+            self._cache[key] = max(jellyfish.jaro_winkler_similarity(name1, name2), SequenceMatcher(None, name1, name2).ratio())
+        return self._cache[key]
+
+    def score_matrix(self, pairs):
+        """
+        Score (name, candidate_name) pairs, returning {(name, candidate_name): score}
+        for the normalized pairs that reach the threshold.
+        """
+        columns = defaultdict(set)
+        for name, candidate in pairs:
+            columns[normalize(candidate)].add(normalize(name))
+
+        scores = {}
+        matcher = SequenceMatcher(None)
+        for candidate, names in columns.items():
+            matcher.set_seq2(candidate)
+            for name in names:
+                score = self._score_entry(matcher, name, candidate)
+                if score is not None: scores[(name, candidate)] = score
+        return scores
+
+    def _score_entry(self, matcher, name, candidate):
+        if (name, candidate) in self._cache:
+            score = self._cache[(name, candidate)]
+            return score if score >= self.threshold else None
+
+        jaro = jellyfish.jaro_winkler_similarity(name, candidate)
+        matcher.set_seq1(name)
+        # real_quick_ratio/quick_ratio are upper bounds on ratio(); only pay for
+        # the full ratio when it could lift the score over jaro or the threshold.
+        bound = max(jaro, self.threshold)
+        if matcher.real_quick_ratio() < bound or matcher.quick_ratio() < bound:
+            if jaro < self.threshold: return None
+            score = jaro
+        else:
+            score = max(jaro, matcher.ratio())
+        self._cache[(name, candidate)] = score
+        return score if score >= self.threshold else None
@@ -0,0 +1,117 @@
+import re
+import unicodedata
+import jellyfish
+from django.db import transaction
+from django.db.models import Q
+
+# CROSS APP IMPORTS
+from heritage.models import Ancestor
+from community.models import AncestorBlockKey
+
+# Nordic letters that NFKD does not decompose into ASCII
+TRANSLITERATIONS = str.maketrans({'ð': 'd', 'þ': 'th', 'æ': 'ae', 'ø': 'o', 'ß': 'ss'})
+TOKEN_PATTERN = re.compile(r'[a-z]+')
+
+
+def normalize_name_tokens(name):
+    """Lowercase, strip accents and split a name into alphabetic tokens."""
+    if not name:
+        return []
+    text = name.lower().translate(TRANSLITERATIONS)
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return TOKEN_PATTERN.findall(text)
+
+
+def name_block_keys(name):
+    """
+    Blocking keys for a name: the phonetic given name, the surname token, the
+    phonetic surname plus given initial, the phonetic given name plus surname
+    initial, and the combined Soundex code. Names that sound alike in their
+    given name or surname share a key, including a lone given name against a
+    full name ('Ingrid' and 'Ingrid Jonsdottir').
+
+    This trades some recall for small blocks: pairs that only look alike as
+    strings are never compared, e.g. different given names with a common
+    patronymic ending ('Sigrid Olafsdottir' and 'Ingrid Jonsdottir').
+    """
+    tokens = normalize_name_tokens(name)
+    if not tokens:
+        return set()
+    first, last = tokens[0], tokens[-1]
+    keys = {f"gn:{jellyfish.metaphone(first)}", f"sn:{last}"}
+    if first == last:
+        return keys | {f"mp:{jellyfish.metaphone(last)}"}
+    return keys | {
+        f"mp:{jellyfish.metaphone(last)}:{first[0]}",
+        f"ny:{jellyfish.nysiis(first)}:{last[0]}",
+        f"sx:{jellyfish.soundex(first)}{jellyfish.soundex(last)}",
+    }
+
+
+def birth_decade(birth_year):
+    return birth_year // 10 if birth_year else None
+
+
+def decade_filter(decade):
+    """Candidates born within a decade either side, or with no known birth year."""
+    if decade is None:
+        return Q()
+    return Q(birth_decade__in=[decade - 1, decade, decade + 1]) | Q(birth_decade__isnull=True)
+
+
+class AncestorBlockingIndex:
+    """Keeps AncestorBlockKey rows in sync and narrows match candidates to shared blocks."""
+
+    def keys_for(self, ancestor):
+        decade = birth_decade(ancestor.birth_year)
+        return [AncestorBlockKey(ancestor_id=ancestor.id, key=key, birth_decade=decade) for key in name_block_keys(ancestor.name)]
+
+    @transaction.atomic
+    def refresh(self, ancestors):
+        ancestors = [a for a in ancestors if a.id]
+        if not ancestors:
+            return
+        AncestorBlockKey.objects.filter(ancestor_id__in=[a.id for a in ancestors]).delete()
+        rows = [row for ancestor in ancestors for row in self.keys_for(ancestor)]
+        AncestorBlockKey.objects.bulk_create(rows, batch_size=1000)
+
+    def candidates(self, ancestor, exclude_user=None):
+        keys = name_block_keys(ancestor.name)
+        if not keys:
+            return Ancestor.objects.none()
+        blocked_ids = (
+            AncestorBlockKey.objects
+            .filter(key__in=keys)
+            .filter(decade_filter(birth_decade(ancestor.birth_year)))
+            .values('ancestor_id')
+        )
+        candidates = Ancestor.objects.filter(id__in=blocked_ids).exclude(user=ancestor.user)
+        if exclude_user:
+            candidates = candidates.exclude(user=exclude_user)
+        return candidates
+
+    def candidates_for(self, ancestors, exclude_user=None, chunk_size=500):
+        """
+        Candidate ancestor ids for many probes at once, as {probe.id: set(ids)}.
+        One key lookup per chunk of keys instead of one query per probe.
+        """
+        probes = {a.id: (name_block_keys(a.name), birth_decade(a.birth_year), a.user_id) for a in ancestors}
+        all_keys = sorted(set().union(*(keys for keys, _, _ in probes.values())))
+
+        by_key = {}
+        for i in range(0, len(all_keys), chunk_size):
+            rows = AncestorBlockKey.objects.filter(key__in=all_keys[i:i + chunk_size])
+            if exclude_user:
+                rows = rows.exclude(ancestor__user=exclude_user)
+            for key, ancestor_id, user_id, decade in rows.values_list('key', 'ancestor_id', 'ancestor__user_id', 'birth_decade'):
+                by_key.setdefault(key, []).append((ancestor_id, user_id, decade))
+
+        candidates = {}
+        for probe_id, (keys, decade, user_id) in probes.items():
+            window = None if decade is None else {decade - 1, decade, decade + 1}
+            candidates[probe_id] = {
+                other_id
+                for key in keys for other_id, other_user, other_decade in by_key.get(key, ())
+                if other_user != user_id and (window is None or other_decade is None or other_decade in window)
+            }
+        return candidates
@@ -1,86 +1,180 @@
 from django.db.models import Q
 from django.contrib.auth.models import User
 from difflib import SequenceMatcher
+from collections import defaultdict
+import heapq
 import jellyfish
 
 # CROSS APP IMPORTS
 from heritage.models import Ancestor
+from heritage.services.closure import generations_above, self_ancestor
+from heritage.services.relations import parse_relation
 from community.models import AncestorMatch, FamilyConnection
+from community.services.blocking_service import AncestorBlockingIndex
+from community.services.batch_scorer import BatchNameScorer, normalize
 
 class FamilyMatchingService:
     def __init__(self):
         self.name_similarity_threshold = 0.85
         self.match_confidence_threshold = 0.7
+        self.max_matches_per_ancestor = 10
+        self.blocking_index = AncestorBlockingIndex()
     
     def name_similarity(self, name1, name2):
         name1, name2 = name1.lower().strip(), name2.lower().strip()
         return max(jellyfish.jaro_winkler_similarity(name1, name2), SequenceMatcher(None, name1, name2).ratio())
     
     def find_matching_ancestors(self, ancestor, exclude_user=None):
-        potential_matches = []
-        other_ancestors = Ancestor.objects.exclude(user=ancestor.user)
-        if exclude_user: other_ancestors = other_ancestors.exclude(user=exclude_user)
+        other_ancestors = self.blocking_index.candidates(ancestor, exclude_user).select_related('birth_location')
+        return self.score_candidates([ancestor], {ancestor.id: list(other_ancestors)}, top_k=None).get(ancestor.id, [])
+    
+    def find_matching_ancestors_batch(self, ancestors, exclude_user=None, top_k=None):
+        """Top-k matches for many ancestors at once, as {ancestor.id: [match, ...]}."""
+        ancestors = list(ancestors)
+        candidates = self._blocked_candidates(ancestors, exclude_user)
+        return self.score_candidates(ancestors, candidates, top_k=top_k or self.max_matches_per_ancestor)
+    
+    def _blocked_candidates(self, ancestors, exclude_user=None):
+        candidate_ids = self.blocking_index.candidates_for(ancestors, exclude_user)
+        others = Ancestor.objects.select_related('birth_location').in_bulk(set().union(*candidate_ids.values()))
+        return {aid: [others[oid] for oid in ids if oid in others] for aid, ids in candidate_ids.items()}
+    
+    def score_candidates(self, ancestors, candidates, top_k=None):
+        scorer = BatchNameScorer(self.name_similarity_threshold)
+        name_scores = scorer.score_matrix((a.name, other.name) for a in ancestors for other in candidates.get(a.id, ()))
         
-        for other_ancestor in other_ancestors:
-            name_sim = self.name_similarity(ancestor.name, other_ancestor.name)
-            if name_sim < self.name_similarity_threshold: continue
-            
-            matching_attrs = {}
-            confidence_factors = [name_sim]
-            
-            if ancestor.birth_year and other_ancestor.birth_year:
-                year_diff = abs(ancestor.birth_year - other_ancestor.birth_year)
-                if year_diff <= 2: matching_attrs['birth_year'], confidence_factors = True, confidence_factors + [1.0]
-                elif year_diff <= 5: matching_attrs['birth_year'], confidence_factors = 'close', confidence_factors + [0.5]
-            
-            if ancestor.origin and other_ancestor.origin:
-                origin_sim = self.name_similarity(ancestor.origin, other_ancestor.origin)
-                if origin_sim > 0.8: matching_attrs['origin'], confidence_factors = True, confidence_factors + [origin_sim]
-            
-            anc_loc = ancestor.birth_location.name if ancestor.birth_location else None
-            other_loc = other_ancestor.birth_location.name if other_ancestor.birth_location else None
-            if anc_loc and other_loc:
-                place_sim = self.name_similarity(anc_loc, other_loc)
-                if place_sim > 0.8: matching_attrs['birth_place'], confidence_factors = True, confidence_factors + [place_sim]
+        results = {}
+        for ancestor in ancestors:
+            potential_matches = []
+            for other_ancestor in candidates.get(ancestor.id, ()):
+                name_sim = name_scores.get((normalize(ancestor.name), normalize(other_ancestor.name)))
+                if name_sim is None: continue
+                
+                matching_attrs = {}
+                confidence_factors = [name_sim]
+                
+                if ancestor.birth_year and other_ancestor.birth_year:
+                    year_diff = abs(ancestor.birth_year - other_ancestor.birth_year)
+                    if year_diff <= 2: matching_attrs['birth_year'], confidence_factors = True, confidence_factors + [1.0]
+                    elif year_diff <= 5: matching_attrs['birth_year'], confidence_factors = 'close', confidence_factors + [0.5]
+                
+                if ancestor.origin and other_ancestor.origin:
+                    origin_sim = scorer.similarity(ancestor.origin, other_ancestor.origin)
+                    if origin_sim > 0.8: matching_attrs['origin'], confidence_factors = True, confidence_factors + [origin_sim]
+                
+                anc_loc = ancestor.birth_location.name if ancestor.birth_location else None
+                other_loc = other_ancestor.birth_location.name if other_ancestor.birth_location else None
+                if anc_loc and other_loc:
+                    place_sim = scorer.similarity(anc_loc, other_loc)
+                    if place_sim > 0.8: matching_attrs['birth_place'], confidence_factors = True, confidence_factors + [place_sim]
+                
+                confidence = sum(confidence_factors) / len(confidence_factors)
+                if confidence >= self.match_confidence_threshold:
+                    potential_matches.append({'ancestor': other_ancestor, 'confidence': confidence, 'matching_attributes': matching_attrs})
             
-            confidence = sum(confidence_factors) / len(confidence_factors)
-            if confidence >= self.match_confidence_threshold:
-                potential_matches.append({'ancestor': other_ancestor, 'confidence': confidence, 'matching_attributes': matching_attrs})
-        return sorted(potential_matches, key=lambda x: x['confidence'], reverse=True)
+            by_confidence = lambda x: x['confidence']
+            results[ancestor.id] = heapq.nlargest(top_k, potential_matches, key=by_confidence) if top_k else sorted(potential_matches, key=by_confidence, reverse=True)
+        return results
     
     def suggest_ancestor_matches_for_user(self, user):
-        user_ancestors = Ancestor.objects.filter(user=user)
-        all_matches = []
-        for ancestor in user_ancestors:
-            matches = self.find_matching_ancestors(ancestor)
-            for match in matches:
-                existing = AncestorMatch.objects.filter(Q(ancestor1=ancestor, ancestor2=match['ancestor']) | Q(ancestor1=match['ancestor'], ancestor2=ancestor)).first()
-                if not existing:
-                    all_matches.append(AncestorMatch.objects.create(
-                        ancestor1=ancestor, ancestor2=match['ancestor'], confidence_score=match['confidence'],
-                        matching_attributes=match['matching_attributes'], status='suggested'
-                    ))
-        return all_matches
+        user_ancestors = Ancestor.objects.filter(user=user).select_related('birth_location')
+        return self.store_matches(user_ancestors, self.find_matching_ancestors_batch(user_ancestors))
+    
+    def refresh_matches_for_ancestors(self, ancestors):
+        """Incremental path: rematch just these ancestors and prune suggestions they no longer earn."""
+        ancestors = list(ancestors)
+        candidates = self._blocked_candidates(ancestors)
+        return self.store_matches(ancestors, self.score_candidates(ancestors, candidates), prune=True)
+    
+    def store_matches(self, ancestors, matches_by_ancestor, prune=False, chunk_size=500):
+        """
+        Upsert 'suggested' AncestorMatch rows in bulk and return how many were inserted.
+        Reviewed (confirmed/rejected) matches are never touched. With prune=True the
+        match lists must be complete, and suggestions missing from them are deleted.
+        """
+        ancestor_ids = [a.id for a in ancestors]
+        existing = {}
+        for i in range(0, len(ancestor_ids), chunk_size):
+            chunk = ancestor_ids[i:i + chunk_size]
+            for m in AncestorMatch.objects.filter(Q(ancestor1_id__in=chunk) | Q(ancestor2_id__in=chunk)):
+                existing[(m.ancestor1_id, m.ancestor2_id)] = m
+        
+        new_matches, updated, kept = {}, [], set()
+        for ancestor in ancestors:
+            for match in matches_by_ancestor.get(ancestor.id, []):
+                pair = AncestorMatch.canonical_pair(ancestor.id, match['ancestor'].id)
+                kept.add(pair)
+                current = existing.get(pair)
+                if current is None:
+                    if pair not in new_matches:
+                        new_matches[pair] = AncestorMatch(
+                            ancestor1_id=pair[0], ancestor2_id=pair[1], confidence_score=match['confidence'],
+                            matching_attributes=match['matching_attributes'], status='suggested'
+                        )
+                elif current.status == 'suggested' and (current.confidence_score, current.matching_attributes) != (match['confidence'], match['matching_attributes']):
+                    current.confidence_score, current.matching_attributes = match['confidence'], match['matching_attributes']
+                    updated.append(current)
+        
+        # Rows a concurrent run inserted first are skipped as conflicts and not counted
+        raced = self.count_stored_pairs(new_matches.keys(), chunk_size)
+        AncestorMatch.objects.bulk_create(new_matches.values(), batch_size=chunk_size, ignore_conflicts=True)
+        created = self.count_stored_pairs(new_matches.keys(), chunk_size) - raced
+        if updated: AncestorMatch.objects.bulk_update(updated, ['confidence_score', 'matching_attributes'], batch_size=chunk_size)
+        if prune:
+            stale_ids = [m.id for pair, m in existing.items() if m.status == 'suggested' and pair not in kept]
+            if stale_ids: AncestorMatch.objects.filter(id__in=stale_ids).delete()
+        return created
+    
+    def count_stored_pairs(self, pairs, chunk_size=500):
+        """How many of the canonical (ancestor1_id, ancestor2_id) pairs have an AncestorMatch row."""
+        pairs, stored = list(pairs), 0
+        for i in range(0, len(pairs), chunk_size):
+            chunk = set(pairs[i:i + chunk_size])
+            rows = AncestorMatch.objects.filter(ancestor1_id__in={a for a, _ in chunk}, ancestor2_id__in={b for _, b in chunk})
+            stored += len(chunk.intersection(rows.values_list('ancestor1_id', 'ancestor2_id')))
+        return stored
+    
+    def get_suggested_matches(self, user):
+        return (
+            AncestorMatch.objects
+            .filter(Q(ancestor1__user=user) | Q(ancestor2__user=user), status='suggested')
+            .select_related('ancestor1__user', 'ancestor2__user')
+            .order_by('-confidence_score')
+        )
     
     def find_family_connections(self, user):
         connections = {}
-        matches = AncestorMatch.objects.filter(Q(ancestor1__in=Ancestor.objects.filter(user=user)) | Q(ancestor2__in=Ancestor.objects.filter(user=user)), status='confirmed')
+        matches = list(AncestorMatch.objects.filter(Q(ancestor1__in=Ancestor.objects.filter(user=user)) | Q(ancestor2__in=Ancestor.objects.filter(user=user)), status='confirmed').select_related('ancestor1__user', 'ancestor2__user'))
+        generations = self.generations_to_users([a for match in matches for a in (match.ancestor1, match.ancestor2)])
         for match in matches:
             other_ancestor = match.ancestor2 if match.ancestor1.user == user else match.ancestor1
             other_user = other_ancestor.user
             if other_user.id not in connections: connections[other_user.id] = {'user': other_user, 'shared_ancestors': [], 'relationship_hints': []}
             connections[other_user.id]['shared_ancestors'].append({'name': match.ancestor1.name, 'relation_to_user1': match.ancestor1.relation, 'relation_to_user2': match.ancestor2.relation})
-            rel_hint = self.infer_user_relationship(match.ancestor1.relation, match.ancestor2.relation)
+            rel_hint = self.infer_user_relationship(generations[match.ancestor1.id], generations[match.ancestor2.id])
             if rel_hint: connections[other_user.id]['relationship_hints'].append(rel_hint)
         return list(connections.values())
     
-    def infer_user_relationship(self, relation1, relation2):
-        r1, r2 = relation1.lower(), relation2.lower()
-        if r1 == r2:
-            if any(x in r1 for x in ['parent', 'father', 'mother']): return 'siblings'
-            elif 'grandparent' in r1: return 'cousins'
-            elif 'great-grandparent' in r1: return 'second cousins'
-        if ('parent' in r1 and 'grandparent' in r2) or ('grandparent' in r1 and 'parent' in r2): return 'parent-child'
+    def generations_to_users(self, ancestors):
+        """
+        Generations between each ancestor and its owner: the closure-table depth above
+        the owner's own node where they recorded one, else parsed from the relation text.
+        """
+        by_user = defaultdict(set)
+        for ancestor in ancestors: by_user[ancestor.user_id].add(ancestor.id)
+        generations = {}
+        for user_id, ids in by_user.items():
+            root = self_ancestor(user_id)
+            if root: generations.update(generations_above(root.id, ids))
+        for ancestor in ancestors:
+            if ancestor.id not in generations: generations[ancestor.id] = parse_relation(ancestor.relation)[0]
+        return generations
+    
+    def infer_user_relationship(self, generation1, generation2):
+        """Relationship between two users from how many generations each sits below a shared ancestor."""
+        if not generation1 or not generation2: return 'related'
+        if generation1 == generation2: return {1: 'siblings', 2: 'cousins', 3: 'second cousins'}.get(generation1, 'related')
+        if {generation1, generation2} == {1, 2}: return 'parent-child'
         return 'related'
     
     def create_family_connection(self, user1, user2, connection_type, shared_ancestor_name, confidence):
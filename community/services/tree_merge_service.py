@@ -1,44 +1,113 @@
+import hashlib
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
 from django.db.models import Q
+from django.utils import timezone
 
 # CROSS APP IMPORTS
-from heritage.models import Ancestor
-from community.models import AncestorMatch, MergedFamilyTree
+from heritage.models import Ancestor, AncestorRelationship
+from heritage.services.data_version import get_data_versions
+from heritage.services.relations import parse_relation
+from community.models import AncestorMatch, MergedFamilyTree, MergedTreeSnapshot
+
+class DisjointSet:
+    """Union-find over ancestor ids with path compression and union by size."""
+    def __init__(self):
+        self.parent, self.size, self.label = {}, {}, {}
+    
+    def __contains__(self, item):
+        return item in self.parent
+    
+    def find(self, item):
+        if item not in self.parent:
+            self.parent[item], self.size[item], self.label[item] = item, 1, item
+            return item
+        root = item
+        while self.parent[root] != root: root = self.parent[root]
+        while self.parent[item] != root: self.parent[item], item = root, self.parent[item]
+        return root
+    
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b: return root_a
+        if self.size[root_a] < self.size[root_b]: root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        self.label[root_a] = min(self.label[root_a], self.label[root_b])
+        return root_a
+    
+    def group_label(self, item):
+        """Smallest member id of the item's group, stable regardless of union order."""
+        return self.label[self.find(item)]
 
 class FamilyTreeMergeService:
     def __init__(self, users):
         self.users = users
     
+    def get_merged_tree(self):
+        """
+        Serve the stored snapshot for this member set while no member's heritage
+        data version has moved, rebuilding and storing it otherwise. Snapshots
+        also age out so signed media URLs inside them stay valid.
+        """
+        member_ids = sorted({user.id for user in self.users})
+        members_key = hashlib.sha256(','.join(map(str, member_ids)).encode()).hexdigest()
+        version = sum(get_data_versions(member_ids).values())
+        max_age = timedelta(seconds=settings.MERGED_TREE_SNAPSHOT_MAX_AGE)
+        
+        snapshot = MergedTreeSnapshot.objects.filter(members_key=members_key).first()
+        if snapshot and snapshot.version == version and snapshot.built_at > timezone.now() - max_age:
+            return snapshot.get_tree()
+        
+        merged_tree = self.build_merged_tree()
+        MergedTreeSnapshot.objects.update_or_create(
+            members_key=members_key,
+            defaults={'member_ids': member_ids, 'version': version, 'data': MergedTreeSnapshot.compress_tree(merged_tree)}
+        )
+        return merged_tree
+    
     def build_merged_tree(self):
         merged_tree = {'nodes': [], 'edges': [], 'clusters': {}}
-        processed, ancestor_map = set(), {}
-        all_ancestors = Ancestor.objects.filter(user__in=self.users).prefetch_related('facts', 'stories', 'media_tags__media', 'events__event')
-        confirmed_matches = AncestorMatch.objects.filter(status='confirmed').filter(Q(ancestor1__user__in=self.users) & Q(ancestor2__user__in=self.users))
+        all_ancestors = Ancestor.objects.filter(user__in=self.users).select_related('user').prefetch_related('facts', 'stories', 'media_tags__media', 'events__event__location')
+        confirmed_pairs = AncestorMatch.objects.filter(status='confirmed').filter(Q(ancestor1__user__in=self.users) & Q(ancestor2__user__in=self.users)).values_list('ancestor1_id', 'ancestor2_id')
         
-        match_groups = {}
-        for match in confirmed_matches:
-            id1, id2 = match.ancestor1.id, match.ancestor2.id
-            group_id = next((gid for gid, members in match_groups.items() if id1 in members or id2 in members), None)
-            if group_id: match_groups[group_id].update([id1, id2])
-            else: match_groups[id1] = {id1, id2}
+        match_groups = DisjointSet()
+        for id1, id2 in confirmed_pairs: match_groups.union(id1, id2)
         
+        ancestor_map, merged_ids = {}, {}
         for ancestor in all_ancestors:
-            merged_id = next((f"merged_{gid}" for gid, mems in match_groups.items() if ancestor.id in mems), f"single_{ancestor.id}")
-            if merged_id in processed:
-                ancestor_map[merged_id].append(ancestor)
-                continue
-            processed.add(merged_id)
-            ancestor_map[merged_id] = [ancestor]
-            
-            merged_data = self.merge_ancestor_data(ancestor_map[merged_id])
+            merged_id = f"merged_{match_groups.group_label(ancestor.id)}" if ancestor.id in match_groups else f"single_{ancestor.id}"
+            ancestor_map.setdefault(merged_id, []).append(ancestor)
+            merged_ids[ancestor.id] = merged_id
+        
+        for merged_id, ancestors in ancestor_map.items():
+            merged_data = self.merge_ancestor_data(ancestors)
             merged_tree['nodes'].append({
                 'id': merged_id, 'name': merged_data['name'], 'birth_year': merged_data['birth_year'], 'death_year': merged_data['death_year'],
                 'origin': merged_data['origin'], 'facts': merged_data['facts'], 'stories': merged_data['stories'], 'events': merged_data['events'],
-                'contributors': [{'user': a.user.username, 'relation_to_user': a.relation} for a in ancestor_map[merged_id]],
+                'contributors': [{'user': a.user.username, 'relation_to_user': a.relation} for a in ancestors],
                 'photo_urls': merged_data['photos']
             })
         
-        merged_tree['edges'] = self.infer_relationships(merged_tree['nodes'])
+        stored_edges, linked = self.stored_relationships(merged_ids)
+        unlinked = [node for node in merged_tree['nodes'] if node['id'] not in linked]
+        merged_tree['edges'] = stored_edges + self.infer_relationships(unlinked)
         return merged_tree
+
+    def stored_relationships(self, merged_ids):
+        """Persisted parent/spouse edges mapped onto merged nodes, plus the set of node ids they touch."""
+        rows = AncestorRelationship.objects.filter(user__in=self.users).values_list('from_ancestor_id', 'to_ancestor_id', 'relationship_type')
+        edges, seen, linked = [], set(), set()
+        for from_id, to_id, kind in rows:
+            a, b = merged_ids.get(from_id), merged_ids.get(to_id)
+            if not a or not b or a == b: continue
+            if kind == 'spouse': a, b = min(a, b), max(a, b)
+            if (a, b, kind) in seen: continue
+            seen.add((a, b, kind))
+            linked.update((a, b))
+            edges.append({'from': a, 'to': b, 'type': 'parent-child' if kind == 'parent' else 'spouse'})
+        return edges, linked
     
     def merge_ancestor_data(self, ancestors):
         merged = {'name': ancestors[0].name, 'birth_year': None, 'death_year': None, 'origin': None, 'facts': {}, 'stories': [], 'photos': [], 'events': []}
@@ -62,17 +131,24 @@ class FamilyTreeMergeService:
         return merged
     
     def infer_relationships(self, nodes):
-        edges = []
+        # Fallback for ancestors without stored edges (AI interview, manual entry).
+        # contributor -> generation -> [(node_id, side)], so each generation is
+        # only ever paired with the one directly above it
+        index = defaultdict(lambda: defaultdict(list))
         for node in nodes:
             for contributor in node['contributors']:
-                relation = contributor['relation_to_user'].lower()
-                if 'father' in relation or 'mother' in relation:
-                    for other_node in nodes:
-                        if other_node['id'] == node['id']: continue
-                        for other_contrib in other_node['contributors']:
-                            other_rel = other_contrib['relation_to_user'].lower()
-                            if ('grandfather' in other_rel or 'grandmother' in other_rel) and contributor['user'] == other_contrib['user']:
-                                edges.append({'from': other_node['id'], 'to': node['id'], 'type': 'parent-child'})
+                generation, side = parse_relation(contributor['relation_to_user'])
+                if generation is not None: index[contributor['user']][generation].append((node['id'], side))
+        
+        edges, seen = [], set()
+        for generations in index.values():
+            for generation, children in generations.items():
+                for parent_id, parent_side in generations.get(generation + 1, ()):
+                    for child_id, child_side in children:
+                        if parent_id == child_id or (parent_side and child_side and parent_side != child_side): continue
+                        if (parent_id, child_id) in seen: continue
+                        seen.add((parent_id, child_id))
+                        edges.append({'from': parent_id, 'to': child_id, 'type': 'parent-child'})
         return edges
     
     def save_merged_tree(self, name, created_by):
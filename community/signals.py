@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# CROSS APP IMPORTS
+from heritage.models import Ancestor
+from heritage.signals import ancestors_changed
+from heritage.services.data_version import bump_data_version
+from .models import AncestorMatch
+from .services.blocking_service import AncestorBlockingIndex
+
+MATCH_TASK_CHUNK_SIZE = 500
+
+
+@receiver(post_save, sender=Ancestor)
+def refresh_ancestor_block_keys(sender, instance, raw=False, **kwargs):
+    """Keep the match blocking index in step with the ancestor's name and birth year."""
+    if raw: return
+    AncestorBlockingIndex().refresh([instance])
+
+
+@receiver(ancestors_changed)
+def refresh_bulk_block_keys(sender, ancestor_ids, bulk=False, **kwargs):
+    """Bulk writes skip post_save, so index those ancestors here."""
+    if not bulk: return
+    AncestorBlockingIndex().refresh(Ancestor.objects.filter(id__in=list(ancestor_ids)).only('id', 'name', 'birth_year'))
+
+
+@receiver(ancestors_changed)
+def queue_ancestor_matching(sender, ancestor_ids, **kwargs):
+    """Rematch only the changed ancestors in the background once the write commits."""
+    ancestor_ids = list(ancestor_ids)
+    if not ancestor_ids: return
+
+    def enqueue():
+        try:
+            from .tasks import match_ancestors
+            for i in range(0, len(ancestor_ids), MATCH_TASK_CHUNK_SIZE):
+                match_ancestors.delay(ancestor_ids[i:i + MATCH_TASK_CHUNK_SIZE])
+        except Exception as e:
+            print(f"Error queuing ancestor matching task: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+@receiver([post_save, post_delete], sender=AncestorMatch)
+def bump_version_for_reviewed_match(sender, instance, signal, raw=False, **kwargs):
+    """Reviewed matches shape merged trees; plain suggestions do not."""
+    if raw or instance.status == 'suggested': return
+    owners = Ancestor.objects.filter(id__in=[instance.ancestor1_id, instance.ancestor2_id]).values_list('user_id', flat=True)
+    bump_data_version(owners, create=signal is post_save)
@@ -0,0 +1,28 @@
+from celery import shared_task
+from django.contrib.auth.models import User
+
+# CROSS APP IMPORTS
+from heritage.models import Ancestor
+from .services.matching_service import FamilyMatchingService
+
+
+@shared_task
+def match_ancestors(ancestor_ids):
+    """
+    Background task to rematch only the given ancestors and upsert their
+    AncestorMatch suggestions.
+    """
+    ancestors = Ancestor.objects.filter(id__in=ancestor_ids).select_related('birth_location')
+    created = FamilyMatchingService().refresh_matches_for_ancestors(ancestors)
+    return f"Created {created} match suggestions for {len(ancestor_ids)} ancestors"
+
+
+@shared_task
+def match_user_ancestors(user_id):
+    """Background task to run the full matching pass for every ancestor of a user."""
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+    created = FamilyMatchingService().suggest_ancestor_matches_for_user(user)
+    return f"Created {created} match suggestions for user {user_id}"
@@ -1,3 +1,192 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+# CROSS APP IMPORTS
+from heritage.models import Ancestor, AncestorFact, UserProfile
+from .models import AncestorMatch, MergedTreeSnapshot
+from .services.batch_scorer import BatchNameScorer, normalize
+from .services.blocking_service import AncestorBlockingIndex, name_block_keys
+from .services.matching_service import FamilyMatchingService
+from .services.tree_merge_service import DisjointSet, FamilyTreeMergeService
+
+
+class NameBlockingTests(TestCase):
+    def test_lone_given_name_shares_a_key_with_the_full_name(self):
+        self.assertTrue(name_block_keys('Ingrid') & name_block_keys('Ingrid Jonsdottir'))
+        self.assertTrue(name_block_keys('Guðrún Jónsdóttir') & name_block_keys('Gudrun Jonsdottir'))
+
+    def test_candidates_come_from_other_users_within_the_decade_window(self):
+        user, other = User.objects.create(username='a'), User.objects.create(username='b')
+        probe = Ancestor.objects.create(user=user, unique_id='a1', name='Ingrid', relation='Grandmother', birth_year=1852)
+        match = Ancestor.objects.create(user=other, unique_id='b1', name='Ingrid Jonsdottir', relation='Grandmother', birth_year=1850)
+        Ancestor.objects.create(user=other, unique_id='b2', name='Ingrid Jonsdottir', relation='Aunt', birth_year=1920)
+        Ancestor.objects.create(user=user, unique_id='a2', name='Ingrid Jonsdottir', relation='Mother', birth_year=1851)
+
+        self.assertEqual(list(AncestorBlockingIndex().candidates(probe)), [match])
+        self.assertEqual(AncestorBlockingIndex().candidates_for([probe]), {probe.id: {match.id}})
+
+
+class BatchNameScorerTests(SimpleTestCase):
+    NAMES = [
+        'Jon Olafsson', 'John Olafson', ' JON OLAFSSON ', 'Olaf Haraldsson', 'Olav Haraldsen', 'Ingrid',
+        'Ingrid Jonsdottir', 'Sigrid Olafsdottir', 'Gudrun Jonsdottir', 'Guðrún Jónsdóttir', 'Bjorn', 'Sigurdur Bjarnason',
+    ]
+
+    def test_scores_match_name_similarity_at_the_threshold(self):
+        service = FamilyMatchingService()
+        pairs = [(a, b) for a in self.NAMES for b in self.NAMES]
+        scores = BatchNameScorer(service.name_similarity_threshold).score_matrix(pairs)
+
+        for name, candidate in pairs:
+            expected = service.name_similarity(name, candidate)
+            with self.subTest(name=name, candidate=candidate):
+                score = scores.get((normalize(name), normalize(candidate)))
+                if expected >= service.name_similarity_threshold:
+                    self.assertAlmostEqual(score, expected)
+                else:
+                    self.assertIsNone(score)
+
+    def test_similarity_matches_name_similarity(self):
+        service, scorer = FamilyMatchingService(), BatchNameScorer(0.85)
+        for name in self.NAMES:
+            self.assertAlmostEqual(scorer.similarity('Olaf Haraldsson', name), service.name_similarity('Olaf Haraldsson', name))
+
+
+class StoreMatchesTests(TestCase):
+    def setUp(self):
+        user, other = User.objects.create(username='a'), User.objects.create(username='b')
+        self.olaf = Ancestor.objects.create(user=user, unique_id='a1', name='Olaf Haraldsson', relation='Grandfather')
+        self.olav = Ancestor.objects.create(user=other, unique_id='b1', name='Olav Haraldsen', relation='Grandfather')
+        self.ola = Ancestor.objects.create(user=other, unique_id='b2', name='Ola Haraldson', relation='Uncle')
+        self.service = FamilyMatchingService()
+
+    def matches(self, *others, confidence=0.9):
+        return {self.olaf.id: [{'ancestor': other, 'confidence': confidence, 'matching_attributes': {}} for other in others]}
+
+    def stored(self):
+        return dict(AncestorMatch.objects.values_list('ancestor2_id', 'confidence_score'))
+
+    def test_storing_again_creates_nothing_and_updates_scores(self):
+        self.assertEqual(self.service.store_matches([self.olaf], self.matches(self.olav, self.ola)), 2)
+        self.assertEqual(self.service.store_matches([self.olaf], self.matches(self.olav, self.ola)), 0)
+        self.assertEqual(self.service.store_matches([self.olaf], self.matches(self.olav, self.ola, confidence=0.8)), 0)
+        self.assertEqual(self.stored(), {self.olav.id: 0.8, self.ola.id: 0.8})
+
+    def test_prune_drops_only_unearned_suggestions(self):
+        self.service.store_matches([self.olaf], self.matches(self.olav, self.ola))
+        AncestorMatch.objects.filter(ancestor2=self.olav).update(status='confirmed')
+
+        self.service.store_matches([self.olaf], {self.olaf.id: []}, prune=True)
+
+        self.assertEqual(list(AncestorMatch.objects.values_list('ancestor2_id', 'status')), [(self.olav.id, 'confirmed')])
+
+    def test_pairs_inserted_concurrently_are_not_counted(self):
+        count_stored_pairs = FamilyMatchingService.count_stored_pairs
+
+        def insert_first(service, pairs, chunk_size=500):
+            # Another worker stores one of the pairs after this run read the existing matches
+            if not AncestorMatch.objects.exists():
+                AncestorMatch.objects.create(ancestor1=self.olaf, ancestor2=self.olav, confidence_score=0.5)
+            return count_stored_pairs(service, pairs, chunk_size)
+
+        with mock.patch.object(FamilyMatchingService, 'count_stored_pairs', insert_first):
+            self.assertEqual(self.service.store_matches([self.olaf], self.matches(self.olav, self.ola)), 1)
+        self.assertEqual(self.stored(), {self.olav.id: 0.5, self.ola.id: 0.9})
+
+
+class MatchGroupTests(TestCase):
+    def test_disjoint_set_merges_bridged_groups_under_the_smallest_id(self):
+        groups = DisjointSet()
+        groups.union(7, 9)
+        groups.union(3, 5)
+        self.assertNotEqual(groups.find(9), groups.find(5))
+
+        groups.union(9, 5)
+
+        self.assertEqual({groups.group_label(i) for i in (3, 5, 7, 9)}, {3})
+        self.assertNotIn(4, groups)
+
+    def test_merged_tree_has_one_node_for_a_chain_of_confirmed_matches(self):
+        users = [User.objects.create(username=name) for name in ('a', 'b', 'c')]
+        olafs = [
+            Ancestor.objects.create(user=user, unique_id=f'olaf_{user.username}', name=name, relation='Grandfather')
+            for user, name in zip(users, ['Olaf Haraldsson', 'Olav Haraldsen', 'Olaf Haraldson'])
+        ]
+        Ancestor.objects.create(user=users[0], unique_id='ingrid', name='Ingrid Jonsdottir', relation='Grandmother')
+        # a~b and b~c are confirmed, so a and c merge through b without a direct match
+        for first, second in ((olafs[1], olafs[2]), (olafs[0], olafs[1])):
+            AncestorMatch.objects.create(ancestor1=first, ancestor2=second, confidence_score=0.9, status='confirmed')
+
+        nodes = FamilyTreeMergeService(User.objects.filter(id__in=[u.id for u in users])).build_merged_tree()['nodes']
+
+        merged = [node for node in nodes if node['id'].startswith('merged_')]
+        self.assertEqual([node['id'] for node in merged], [f"merged_{olafs[0].id}"])
+        self.assertEqual(sorted(c['user'] for c in merged[0]['contributors']), ['a', 'b', 'c'])
+        self.assertEqual(len(nodes), 2)
+
+
+class MergedTreeSnapshotTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username='a'), User.objects.create(username='b')]
+        self.olaf = Ancestor.objects.create(user=self.users[0], unique_id='a1', name='Olaf Haraldsson', relation='Grandfather')
+        self.olav = Ancestor.objects.create(user=self.users[1], unique_id='b1', name='Olav Haraldsen', relation='Grandfather')
+        self.match = AncestorMatch.objects.create(ancestor1=self.olaf, ancestor2=self.olav, confidence_score=0.9)
+        build = FamilyTreeMergeService.build_merged_tree
+        patcher = mock.patch.object(FamilyTreeMergeService, 'build_merged_tree', autospec=True, side_effect=build)
+        self.build = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def merged_tree(self):
+        return FamilyTreeMergeService(User.objects.filter(id__in=[u.id for u in self.users])).get_merged_tree()
+
+    def test_snapshot_is_served_while_versions_are_unchanged(self):
+        tree = self.merged_tree()
+        self.assertEqual(self.merged_tree(), tree)
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual(MergedTreeSnapshot.objects.count(), 1)
+
+    def test_ancestor_and_fact_edits_rebuild_the_snapshot(self):
+        self.merged_tree()
+        self.olaf.name = 'Olaf the Fisher'
+        self.olaf.save()
+        names = {node['name'] for node in self.merged_tree()['nodes']}
+        self.assertIn('Olaf the Fisher', names)
+
+        AncestorFact.objects.create(ancestor=self.olav, key='OCCU', value='Fisherman')
+        self.merged_tree()
+        self.assertEqual(self.build.call_count, 3)
+
+    def test_confirming_a_match_rebuilds_the_snapshot(self):
+        self.assertEqual(len(self.merged_tree()['nodes']), 2)
+        self.match.status = 'confirmed'
+        self.match.save()
+
+        nodes = self.merged_tree()['nodes']
+        self.assertEqual([node['id'] for node in nodes], [f"merged_{self.olaf.id}"])
+        self.assertEqual(self.build.call_count, 2)
+
+    @override_settings(MERGED_TREE_SNAPSHOT_MAX_AGE=0)
+    def test_snapshot_older_than_the_max_age_is_rebuilt(self):
+        self.merged_tree()
+        self.merged_tree()
+        self.assertEqual(self.build.call_count, 2)
+
+
+class UserDeletionTests(TestCase):
+    def test_deleting_a_user_with_a_tree_and_a_confirmed_match(self):
+        user, other = User.objects.create(username='a'), User.objects.create(username='b')
+        olaf = Ancestor.objects.create(user=user, unique_id='a1', name='Olaf Haraldsson', relation='Grandfather')
+        AncestorFact.objects.create(ancestor=olaf, key='OCCU', value='Fisherman')
+        olav = Ancestor.objects.create(user=other, unique_id='b1', name='Olav Haraldsen', relation='Grandfather')
+        AncestorMatch.objects.create(ancestor1=olaf, ancestor2=olav, confidence_score=0.9, status='confirmed')
+        before = UserProfile.objects.get(user=other).data_version
+
+        user.delete()
+        connection.check_constraints()
+
+        self.assertFalse(UserProfile.objects.filter(user_id=user.id).exists())
+        self.assertFalse(Ancestor.objects.filter(user_id=user.id).exists())
+        self.assertGreater(UserProfile.objects.get(user=other).data_version, before)
@@ -81,7 +81,16 @@ def find_potential_matches(request):
             user = get_user_for_request(request)
             matching_service = FamilyMatchingService()
             
-            matches = matching_service.suggest_ancestor_matches_for_user(user)
+            # Suggestions are kept current by the match_ancestors task on every
+            # Ancestor write; ?refresh=true queues a full pass for this user.
+            if request.GET.get('refresh') == 'true':
+                try:
+                    from .tasks import match_user_ancestors
+                    match_user_ancestors.delay(user.id)
+                except Exception as e:
+                    print(f"Error queuing matching task: {e}")
+            
+            matches = matching_service.get_suggested_matches(user)
             connections = matching_service.find_family_connections(user)
             
             return JsonResponse({
@@ -128,12 +137,13 @@ def confirm_ancestor_match(request, match_id):
             match.save()
             
             matching_service = FamilyMatchingService()
+            generations = matching_service.generations_to_users([match.ancestor1, match.ancestor2])
             connection = matching_service.create_family_connection(
                 match.ancestor1.user,
                 match.ancestor2.user,
                 matching_service.infer_user_relationship(
-                    match.ancestor1.relation,
-                    match.ancestor2.relation
+                    generations[match.ancestor1.id],
+                    generations[match.ancestor2.id]
                 ),
                 match.ancestor1.name,
                 match.confidence_score
@@ -161,7 +171,7 @@ def get_merged_family_tree(request):
             users = User.objects.filter(id__in=user_ids)
             
             merge_service = FamilyTreeMergeService(users)
-            merged_tree = merge_service.build_merged_tree()
+            merged_tree = merge_service.get_merged_tree()
             
             return JsonResponse(merged_tree, status=200)
             
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.15 on 2026-10-16 22:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("heritage", "0003_importbatch_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AncestorRelationship",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "relationship_type",
+                    models.CharField(
+                        choices=[("parent", "Parent"), ("spouse", "Spouse")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "from_ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="relationships_out",
+                        to="heritage.ancestor",
+                    ),
+                ),
+                (
+                    "import_batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="heritage.importbatch",
+                    ),
+                ),
+                (
+                    "to_ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="relationships_in",
+                        to="heritage.ancestor",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_relationships",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["to_ancestor", "relationship_type"],
+                        name="heritage_rel_to_type",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ancestorrelationship",
+            constraint=models.UniqueConstraint(
+                fields=("from_ancestor", "to_ancestor", "relationship_type"),
+                name="unique_ancestor_relationship",
+            ),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+
+from heritage.services.closure import closure_layers
+
+
+def backfill_closure(apps, schema_editor):
+    AncestorRelationship = apps.get_model("heritage", "AncestorRelationship")
+    AncestorClosure = apps.get_model("heritage", "AncestorClosure")
+    parents = defaultdict(set)
+    for parent_id, child_id in AncestorRelationship.objects.filter(
+        relationship_type="parent"
+    ).values_list("from_ancestor_id", "to_ancestor_id"):
+        parents[child_id].add(parent_id)
+    for rows in closure_layers(set(parents), parents, lambda ids: {}):
+        AncestorClosure.objects.bulk_create(
+            [
+                AncestorClosure(ancestor_id=a, descendant_id=d, depth=depth)
+                for a, d, depth in rows
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0004_ancestorrelationship"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AncestorClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="heritage.ancestor",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="heritage.ancestor",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "depth"], name="heritage_closure_up"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ancestorclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="unique_ancestor_closure"
+            ),
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
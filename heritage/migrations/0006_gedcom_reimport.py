@@ -0,0 +1,77 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_gedcom_xrefs(apps, schema_editor):
+    # Earlier imports only kept the xref inside unique_id ("gedcom_<batch>_<xref>")
+    Ancestor = apps.get_model("heritage", "Ancestor")
+    rows = []
+    for ancestor in (
+        Ancestor.objects.filter(source_type="gedcom", unique_id__startswith="gedcom_")
+        .only("id", "unique_id")
+        .iterator(chunk_size=2000)
+    ):
+        parts = ancestor.unique_id.split("_", 2)
+        if len(parts) < 3:
+            continue
+        ancestor.gedcom_xref = parts[2]
+        rows.append(ancestor)
+        if len(rows) >= 2000:
+            Ancestor.objects.bulk_update(rows, ["gedcom_xref"])
+            rows = []
+    Ancestor.objects.bulk_update(rows, ["gedcom_xref"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0005_ancestorclosure"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ancestor",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="ancestor",
+            name="gedcom_xref",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="importbatch",
+            name="created_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importbatch",
+            name="deleted_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importbatch",
+            name="source_batch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="reimports",
+                to="heritage.importbatch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="importbatch",
+            name="updated_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="ancestor",
+            index=models.Index(
+                fields=["import_batch", "gedcom_xref"], name="heritage_ancestor_xref"
+            ),
+        ),
+        migrations.RunPython(backfill_gedcom_xrefs, migrations.RunPython.noop),
+    ]
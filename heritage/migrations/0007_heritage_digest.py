@@ -0,0 +1,23 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0006_gedcom_reimport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="digest_version",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="heritage_digest",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.15 on 2026-10-16 23:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+import django.db.models.deletion
+
+
+def backfill_import_batches(apps, schema_editor):
+    # Imports stored GEDCOM tags (upper case) as fact keys and titled life
+    # events "Birth of"/"Passing of"; anything else was added by hand or the AI
+    Ancestor = apps.get_model("heritage", "Ancestor")
+    AncestorFact = apps.get_model("heritage", "AncestorFact")
+    EventParticipation = apps.get_model("heritage", "EventParticipation")
+    HeritageEvent = apps.get_model("heritage", "HeritageEvent")
+    ancestor = Ancestor.objects.filter(pk=OuterRef("ancestor_id"))
+    AncestorFact.objects.filter(
+        ancestor__source_type="gedcom",
+        ancestor__import_batch__isnull=False,
+        key__regex=r"^[A-Z0-9_]+$",
+    ).update(import_batch=Subquery(ancestor.values("import_batch")[:1]))
+    HeritageEvent.objects.filter(
+        Q(title__startswith="Birth of ") | Q(title__startswith="Passing of "),
+        participants__ancestor__source_type="gedcom",
+        participants__ancestor__import_batch__isnull=False,
+    ).update(
+        import_batch=Subquery(
+            EventParticipation.objects.filter(
+                event=OuterRef("pk"), ancestor__import_batch__isnull=False
+            ).values("ancestor__import_batch")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heritage", "0007_heritage_digest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ancestorfact",
+            name="import_batch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="heritage.importbatch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="heritageevent",
+            name="import_batch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="heritage.importbatch",
+            ),
+        ),
+        migrations.RunPython(backfill_import_batches, migrations.RunPython.noop),
+    ]
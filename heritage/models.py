@@ -2,10 +2,29 @@ from django.db import models
 from django.contrib.auth.models import User
 
 class ImportBatch(models.Model):
+    MAX_STORED_ERRORS = 50
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     filename = models.CharField(max_length=200)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    status = models.CharField(max_length=20, choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing')
+    status = models.CharField(max_length=20, choices=[('queued', 'Queued'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing')
+    staged_file = models.CharField(max_length=500, blank=True)
+    total_individuals = models.PositiveIntegerField(default=0)
+    processed_individuals = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Re-imports point at the family file's first batch and only write what changed
+    source_batch = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='reimports')
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    deleted_count = models.PositiveIntegerField(default=0)
+
+    def eta_seconds(self, now):
+        if self.status != 'processing' or not self.started_at or not self.processed_individuals: return None
+        rate = self.processed_individuals / max((now - self.started_at).total_seconds(), 0.001)
+        return round(max(self.total_individuals - self.processed_individuals, 0) / rate, 1)
 
 class HeritageLocation(models.Model):
     name = models.CharField(max_length=200)
@@ -23,6 +42,11 @@ class UserProfile(models.Model):
     interview_started_at = models.DateTimeField(null=True, blank=True)
     interview_completed_at = models.DateTimeField(null=True, blank=True)
     json_backup_url = models.URLField(blank=True, null=True)
+    # Bumped on every change to the user's heritage data; used to invalidate derived caches
+    data_version = models.PositiveIntegerField(default=0)
+    # Bounded summary of the tree for LLM prompts, as of data_version == digest_version
+    heritage_digest = models.JSONField(default=dict, blank=True)
+    digest_version = models.PositiveIntegerField(null=True, blank=True)
 
 class Ancestor(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestors')
@@ -38,11 +62,40 @@ class Ancestor(models.Model):
     birth_location = models.ForeignKey(HeritageLocation, related_name='births', null=True, blank=True, on_delete=models.SET_NULL)
     origin = models.CharField(max_length=200, blank=True)
     source_type = models.CharField(max_length=20, choices=[('ai_chat', 'AI Interview'), ('manual', 'Manual Entry'), ('gedcom', 'GEDCOM')], default='ai_chat')
+    gedcom_xref = models.CharField(max_length=50, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['import_batch', 'gedcom_xref'], name='heritage_ancestor_xref')]
+
+class AncestorRelationship(models.Model):
+    """A parent->child edge, or a spouse edge stored once with the lower ancestor id first."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestor_relationships')
+    from_ancestor = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='relationships_out')
+    to_ancestor = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='relationships_in')
+    relationship_type = models.CharField(max_length=10, choices=[('parent', 'Parent'), ('spouse', 'Spouse')])
+    import_batch = models.ForeignKey(ImportBatch, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['from_ancestor', 'to_ancestor', 'relationship_type'], name='unique_ancestor_relationship')]
+        indexes = [models.Index(fields=['to_ancestor', 'relationship_type'], name='heritage_rel_to_type')]
+
+class AncestorClosure(models.Model):
+    """Transitive closure of parent edges: one row per (ancestor, descendant) at the shortest depth."""
+    ancestor = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_ancestor_closure')]
+        indexes = [models.Index(fields=['descendant', 'depth'], name='heritage_closure_up')]
 
 class AncestorFact(models.Model):
     ancestor = models.ForeignKey(Ancestor, on_delete=models.CASCADE, related_name='facts')
     key = models.CharField(max_length=100)
     value = models.TextField()
+    # Set on rows a GEDCOM import wrote, so re-imports only replace their own
+    import_batch = models.ForeignKey(ImportBatch, null=True, blank=True, on_delete=models.SET_NULL)
 
 class HeritageEvent(models.Model):
     title = models.CharField(max_length=200)
@@ -51,6 +104,7 @@ class HeritageEvent(models.Model):
     date_end = models.DateField(null=True, blank=True)
     location = models.ForeignKey(HeritageLocation, on_delete=models.SET_NULL, null=True, blank=True)
     event_type = models.CharField(max_length=20, choices=[('personal', 'Personal'), ('community', 'Community')], default='personal')
+    import_batch = models.ForeignKey(ImportBatch, null=True, blank=True, on_delete=models.SET_NULL)
 
 class EventParticipation(models.Model):
     event = models.ForeignKey(HeritageEvent, on_delete=models.CASCADE, related_name='participants')
@@ -0,0 +1,107 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Q
+
+from heritage.models import Ancestor, AncestorClosure, AncestorRelationship
+from .relations import SELF_WORDS
+
+INSERT_BATCH_SIZE = 1000
+SELF_RELATION = r'^\s*(%s)\s*$' % '|'.join(sorted(SELF_WORDS))
+
+
+def closure_layers(nodes, parents, load_above):
+    """
+    Yield [(ancestor_id, descendant_id, depth)] one generation layer at a time for
+    the given nodes, parents first. parents maps node -> parent ids; load_above(ids)
+    returns {id: {ancestor_id: depth}} for parents outside the node set. Nodes
+    caught in a parent cycle are left without rows.
+    """
+    remaining, known = set(nodes), {}
+    while remaining:
+        layer = [n for n in remaining if not (parents.get(n, set()) & remaining)]
+        if not layer: return
+        outside = {p for n in layer for p in parents.get(n, ()) if p not in known}
+        if outside:
+            known.update(load_above(outside))
+            for parent in outside: known.setdefault(parent, {})
+        rows = []
+        for node in layer:
+            depths = {}
+            for parent in parents.get(node, ()):
+                depths[parent] = 1
+                for ancestor_id, depth in known.get(parent, {}).items():
+                    if ancestor_id not in depths or depth + 1 < depths[ancestor_id]: depths[ancestor_id] = depth + 1
+            known[node] = depths
+            rows.extend((ancestor_id, node, depth) for ancestor_id, depth in depths.items())
+        remaining.difference_update(layer)
+        yield rows
+
+
+def _load_above(ids):
+    above = defaultdict(dict)
+    for ancestor_id, descendant_id, depth in AncestorClosure.objects.filter(descendant_id__in=ids).values_list('ancestor_id', 'descendant_id', 'depth'):
+        above[descendant_id][ancestor_id] = depth
+    return above
+
+
+@transaction.atomic
+def rebuild_closure(ancestor_ids):
+    """
+    Recompute closure rows for the given ancestors and everything below them.
+    Called after parent edges into those ancestors are added or removed; the
+    work is bounded by the affected subtree, a few queries per generation.
+    """
+    ancestor_ids = set(ancestor_ids)
+    if not ancestor_ids: return
+    affected = ancestor_ids | set(AncestorClosure.objects.filter(ancestor_id__in=ancestor_ids).values_list('descendant_id', flat=True))
+    affected &= set(Ancestor.objects.filter(id__in=affected).values_list('id', flat=True))
+    AncestorClosure.objects.filter(descendant_id__in=affected).delete()
+
+    parents = defaultdict(set)
+    for parent_id, child_id in AncestorRelationship.objects.filter(to_ancestor_id__in=affected, relationship_type='parent').values_list('from_ancestor_id', 'to_ancestor_id'):
+        parents[child_id].add(parent_id)
+    for rows in closure_layers(affected, parents, _load_above):
+        AncestorClosure.objects.bulk_create([
+            AncestorClosure(ancestor_id=a, descendant_id=d, depth=depth) for a, d, depth in rows
+        ], batch_size=INSERT_BATCH_SIZE)
+
+
+def ancestors_of(ancestor_id, max_depth=None):
+    rows = AncestorClosure.objects.filter(descendant_id=ancestor_id)
+    if max_depth: rows = rows.filter(depth__lte=max_depth)
+    return rows.select_related('ancestor').order_by('depth', 'ancestor_id')
+
+
+def descendants_of(ancestor_id, max_depth=None):
+    rows = AncestorClosure.objects.filter(ancestor_id=ancestor_id)
+    if max_depth: rows = rows.filter(depth__lte=max_depth)
+    return rows.select_related('descendant').order_by('depth', 'descendant_id')
+
+
+def common_ancestors(ancestor_a, ancestor_b):
+    """Shared ancestors of two people as [(ancestor, depth_from_a, depth_from_b)], nearest first."""
+    depths_b = dict(AncestorClosure.objects.filter(descendant_id=ancestor_b).values_list('ancestor_id', 'depth'))
+    shared = ancestors_of(ancestor_a).filter(ancestor_id__in=list(depths_b))
+    return sorted(((row.ancestor, row.depth, depths_b[row.ancestor_id]) for row in shared), key=lambda r: (r[1] + r[2], r[0].id))
+
+
+def generation_distance(ancestor_a, ancestor_b):
+    """Generations from a down to b: positive if a is b's ancestor, negative if b is a's, 0 if same, else None."""
+    if ancestor_a == ancestor_b: return 0
+    row = AncestorClosure.objects.filter(
+        Q(ancestor_id=ancestor_a, descendant_id=ancestor_b) | Q(ancestor_id=ancestor_b, descendant_id=ancestor_a)
+    ).values_list('ancestor_id', 'depth').first()
+    if row is None: return None
+    return row[1] if row[0] == ancestor_a else -row[1]
+
+
+def self_ancestor(user_id):
+    """The ancestor row standing for the user themself, if they recorded one."""
+    return Ancestor.objects.filter(user_id=user_id, relation__iregex=SELF_RELATION).order_by('id').first()
+
+
+def generations_above(root_id, ancestor_ids):
+    """{ancestor_id: generations above root} for those of the ids that are root's ancestors."""
+    generations = dict(AncestorClosure.objects.filter(descendant_id=root_id, ancestor_id__in=ancestor_ids).values_list('ancestor_id', 'depth'))
+    if root_id in ancestor_ids: generations[root_id] = 0
+    return generations
@@ -0,0 +1,26 @@
+from django.db.models import F
+
+from heritage.models import UserProfile
+
+
+def bump_data_version(user_ids, create=True):
+    """Increment the heritage data version of each user, creating profiles as needed.
+
+    Delete paths pass create=False: the user may be the one being deleted, and a
+    profile recreated for them would break the cascade's foreign key.
+    """
+    user_ids = {uid for uid in user_ids if uid}
+    if not user_ids: return
+    if not create:
+        UserProfile.objects.filter(user_id__in=user_ids).update(data_version=F('data_version') + 1)
+        return
+    existing = set(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    UserProfile.objects.filter(user_id__in=existing).update(data_version=F('data_version') + 1)
+    missing = user_ids - existing
+    if missing:
+        UserProfile.objects.bulk_create([UserProfile(user_id=uid, data_version=1) for uid in missing], ignore_conflicts=True)
+
+
+def get_data_versions(user_ids):
+    versions = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'data_version'))
+    return {uid: versions.get(uid, 0) for uid in user_ids}
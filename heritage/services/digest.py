@@ -0,0 +1,99 @@
+from collections import Counter
+from django.db.models import Case, Count, Exists, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from heritage.models import Ancestor, AncestorFact, AncestorRelationship, EventParticipation, MediaTag, Story, UserProfile
+
+TOP_ANCESTORS = 12
+TOP_LOCATIONS = 8
+MAX_GAPS = 8
+GAP_NAMES = 5
+
+
+def related_count(model):
+    rows = model.objects.filter(ancestor=OuterRef('pk')).order_by().values('ancestor').annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def present(field):
+    return Case(When(**{f"{field}__isnull": False}, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def life_span(year, date, place=None):
+    text = str(date or year or '')
+    if place: text = f"{text}, {place}" if text else place
+    return text or None
+
+
+def build_heritage_digest(user_id):
+    """
+    Bounded summary of a user's heritage data for LLM prompts: counts, date
+    range, main places, the most complete ancestors and notable gaps. Its
+    size does not grow with the tree.
+    """
+    ancestors = Ancestor.objects.filter(user_id=user_id)
+    totals = ancestors.aggregate(
+        ancestors=Count('id'), earliest=Min('birth_year'), latest=Max('birth_year'),
+        no_birth_year=Count('id', filter=Q(birth_year__isnull=True)),
+        no_birthplace=Count('id', filter=Q(birth_location__isnull=True)),
+    )
+    events = EventParticipation.objects.filter(ancestor__user_id=user_id)
+    counts = {
+        'ancestors': totals['ancestors'],
+        'stories': Story.objects.filter(user_id=user_id).count(),
+        'events': events.values('event').distinct().count(),
+        'photos': MediaTag.objects.filter(ancestor__user_id=user_id).values('media').distinct().count(),
+    }
+
+    places = Counter(dict(
+        ancestors.filter(birth_location__isnull=False).values_list('birth_location__name').annotate(n=Count('id'))
+    ))
+    places.update(dict(
+        events.filter(event__location__isnull=False).values_list('event__location__name').annotate(n=Count('event', distinct=True))
+    ))
+
+    ranked = ancestors.annotate(
+        n_facts=related_count(AncestorFact), n_stories=related_count(Story),
+        n_photos=related_count(MediaTag), n_events=related_count(EventParticipation),
+        has_parents=Exists(AncestorRelationship.objects.filter(to_ancestor=OuterRef('pk'), relationship_type='parent')),
+    ).annotate(
+        completeness=present('birth_year') + present('birth_location') + present('death_year')
+        + F('n_facts') + 2 * F('n_stories') + F('n_photos') + F('n_events')
+    ).select_related('birth_location').order_by('-completeness', 'id')[:TOP_ANCESTORS]
+
+    people, no_parents, no_stories = [], [], []
+    for ancestor in ranked:
+        person = {
+            'name': ancestor.name, 'relation': ancestor.relation,
+            'born': life_span(ancestor.birth_year, ancestor.birth_date, ancestor.birth_location and ancestor.birth_location.name),
+            'died': life_span(ancestor.death_year, ancestor.death_date),
+            'facts': ancestor.n_facts, 'stories': ancestor.n_stories, 'photos': ancestor.n_photos, 'events': ancestor.n_events,
+        }
+        people.append({key: value for key, value in person.items() if value})
+        if not ancestor.has_parents: no_parents.append(ancestor.name)
+        if not ancestor.n_stories: no_stories.append(ancestor.name)
+
+    gaps = []
+    if totals['no_birth_year']: gaps.append(f"{totals['no_birth_year']} of {totals['ancestors']} ancestors have no birth year")
+    if totals['no_birthplace']: gaps.append(f"{totals['no_birthplace']} of {totals['ancestors']} ancestors have no birthplace")
+    if no_parents: gaps.append(f"No parents recorded for {', '.join(no_parents[:GAP_NAMES])}")
+    if no_stories: gaps.append(f"No stories about {', '.join(no_stories[:GAP_NAMES])}")
+    if not counts['stories']: gaps.append("No stories recorded yet")
+    if not counts['photos']: gaps.append("No photos tagged yet")
+    return {
+        'counts': counts,
+        'birth_years': [totals['earliest'], totals['latest']] if totals['earliest'] else None,
+        'places': [name for name, _ in places.most_common(TOP_LOCATIONS)],
+        'ancestors': people,
+        'gaps': gaps[:MAX_GAPS],
+    }
+
+
+def heritage_digest(profile):
+    """The profile's stored digest, rebuilt first if the user's heritage data changed since it was made."""
+    if profile.digest_version != profile.data_version:
+        version = profile.data_version
+        digest = build_heritage_digest(profile.user_id)
+        UserProfile.objects.filter(pk=profile.pk).update(heritage_digest=digest, digest_version=version)
+        profile.heritage_digest, profile.digest_version = digest, version
+    return profile.heritage_digest
@@ -0,0 +1,138 @@
+import re
+from collections import defaultdict
+from django.utils import timezone
+
+from heritage.models import Ancestor, AncestorRelationship
+
+EXPORT_CHUNK_SIZE = 500
+MAX_LINE_VALUE = 200
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+# INDI tags that take a free-text value in GEDCOM 5.5.1: the individual attributes and NOTE.
+# Other fact keys are written as FACT + TYPE, unless they are already custom (_) tags.
+INDI_TEXT_TAGS = {'CAST', 'DSCR', 'EDUC', 'IDNO', 'NATI', 'NCHI', 'NMR', 'NOTE', 'OCCU', 'PROP', 'RELI', 'SSN', 'TITL'}
+CUSTOM_TAG = re.compile(r'^_[A-Z0-9_]{1,30}$')
+LIFE_EVENT_TITLE = re.compile(r'^(Birth|Passing) of ')
+
+
+def gedcom_date(date, year):
+    if date: return f"{date.day} {MONTHS[date.month - 1]} {date.year}"
+    return str(year) if year else ''
+
+
+def gedcom_name(name):
+    parts = name.split()
+    if len(parts) < 2: return name
+    return f"{' '.join(parts[:-1])} /{parts[-1]}/"
+
+
+def value_lines(level, tag, value):
+    """A tag line, continued with CONT for newlines and CONC for text past the line limit."""
+    lines = []
+    for i, text in enumerate(str(value).splitlines() or ['']):
+        pieces = [text[j:j + MAX_LINE_VALUE] for j in range(0, len(text), MAX_LINE_VALUE)] or ['']
+        head = f"{level} {tag}" if i == 0 else f"{level + 1} CONT"
+        lines.append(f"{head} {pieces[0]}" if pieces[0] else head)
+        lines.extend(f"{level + 1} CONC {piece}" for piece in pieces[1:])
+    return lines
+
+
+def place_lines(level, location):
+    lines = value_lines(level, 'PLAC', location.name)
+    if location.latitude is not None and location.longitude is not None:
+        lat, lon = location.latitude, location.longitude
+        lines += [f"{level + 1} MAP", f"{level + 2} LATI {'N' if lat >= 0 else 'S'}{abs(lat)}", f"{level + 2} LONG {'E' if lon >= 0 else 'W'}{abs(lon)}"]
+    return lines
+
+
+class GedcomExportService:
+    """
+    Streams a user's tree as GEDCOM 5.5.1, one record at a time. Ancestors are
+    read with a server-side cursor in chunks; only the family grouping (ids)
+    is held in memory.
+    """
+
+    def __init__(self, user, chunk_size=EXPORT_CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+
+    def build_families(self):
+        """[(family xref, [(HUSB/WIFE, parent id)], child ids)] from stored parent and spouse edges."""
+        genders = dict(Ancestor.objects.filter(user=self.user).values_list('id', 'gender'))
+        parents_of = defaultdict(set)
+        spouses = set()
+        for from_id, to_id, kind in AncestorRelationship.objects.filter(user=self.user).values_list('from_ancestor_id', 'to_ancestor_id', 'relationship_type'):
+            if kind == 'parent': parents_of[to_id].add(from_id)
+            else: spouses.add((from_id, to_id))
+
+        children_of = defaultdict(list)
+        for child, parents in parents_of.items(): children_of[tuple(sorted(parents))].append(child)
+        for pair in spouses - set(children_of): children_of[pair] = []
+
+        families = []
+        for n, (parents, children) in enumerate(sorted(children_of.items()), 1):
+            # Men first so they land on HUSB; a lone mother is the WIFE
+            parents = sorted(parents, key=lambda ancestor_id: (genders.get(ancestor_id) != 'M', genders.get(ancestor_id) == 'F'))[:2]
+            roles = ['WIFE'] if len(parents) == 1 and genders.get(parents[0]) == 'F' else ['HUSB', 'WIFE']
+            families.append((f"F{n}", list(zip(roles, parents)), sorted(children)))
+        return families
+
+    def header(self):
+        return '\n'.join([
+            '0 HEAD', '1 SOUR VIKING_ROOTS', '2 NAME Viking Roots', '1 GEDC', '2 VERS 5.5.1', '2 FORM LINEAGE-LINKED',
+            '1 CHAR UTF-8', f"1 DATE {gedcom_date(timezone.now().date(), None)}", '1 SUBM @SUBM@',
+            '0 @SUBM@ SUBM', *value_lines(1, 'NAME', self.user.get_full_name() or self.user.username),
+        ]) + '\n'
+
+    def individual(self, ancestor, famc, fams):
+        lines = [f"0 @I{ancestor.id}@ INDI", *value_lines(1, 'NAME', gedcom_name(ancestor.name))]
+        lines.append(f"1 SEX {ancestor.gender if ancestor.gender in ('M', 'F') else 'U'}")
+        birth = gedcom_date(ancestor.birth_date, ancestor.birth_year)
+        if birth or ancestor.birth_location:
+            lines.append('1 BIRT')
+            if birth: lines.append(f"2 DATE {birth}")
+            if ancestor.birth_location: lines += place_lines(2, ancestor.birth_location)
+        death = gedcom_date(ancestor.death_date, ancestor.death_year)
+        if death: lines += ['1 DEAT', f"2 DATE {death}"]
+
+        for fact in ancestor.facts.all():
+            if fact.key in INDI_TEXT_TAGS or CUSTOM_TAG.match(fact.key): lines += value_lines(1, fact.key, fact.value)
+            else: lines += value_lines(1, 'FACT', fact.value) + value_lines(2, 'TYPE', fact.key)
+        for participation in ancestor.events.all():
+            event = participation.event
+            # Birth/death events duplicate BIRT/DEAT above
+            if LIFE_EVENT_TITLE.match(event.title): continue
+            lines += ['1 EVEN', *value_lines(2, 'TYPE', event.title)]
+            if event.date_start: lines.append(f"2 DATE {gedcom_date(event.date_start, None)}")
+            if event.location: lines += place_lines(2, event.location)
+            if participation.role: lines += value_lines(2, 'ROLE', participation.role)
+            if event.description: lines += value_lines(2, 'NOTE', event.description)
+
+        if ancestor.id in famc: lines.append(f"1 FAMC @{famc[ancestor.id]}@")
+        lines += [f"1 FAMS @{family}@" for family in fams.get(ancestor.id, ())]
+        return '\n'.join(lines) + '\n'
+
+    def family(self, xref, parents, children):
+        lines = [f"0 @{xref}@ FAM"]
+        lines += [f"1 {role} @I{parent}@" for role, parent in parents]
+        lines += [f"1 CHIL @I{child}@" for child in children]
+        return '\n'.join(lines) + '\n'
+
+    def stream(self):
+        """Yield the export one record at a time."""
+        yield self.header()
+
+        families = self.build_families()
+        famc, fams = {}, defaultdict(list)
+        for xref, parents, children in families:
+            for child in children: famc.setdefault(child, xref)
+            for _, parent in parents: fams[parent].append(xref)
+
+        ancestors = (
+            Ancestor.objects.filter(user=self.user).order_by('id')
+            .select_related('birth_location').prefetch_related('facts', 'events__event__location')
+        )
+        for ancestor in ancestors.iterator(chunk_size=self.chunk_size):
+            yield self.individual(ancestor, famc, fams)
+        for xref, parents, children in families:
+            yield self.family(xref, parents, children)
+        yield '0 TRLR\n'
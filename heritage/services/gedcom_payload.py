@@ -0,0 +1,63 @@
+"""
+Conversion of streamed GEDCOM records into row payloads. Kept free of Django
+imports so shards can be converted in separate worker processes.
+"""
+import hashlib
+import io
+import json
+
+from .gedcom_reader import GedcomReader
+
+# FAMC/FAMS pointers are kept as relationship edges rather than facts
+IGNORED_FACT_TAGS = {'BIRT', 'DEAT', 'NAME', 'SEX', 'FAMC', 'FAMS'}
+
+
+def content_hash(payload):
+    """Stable hash of an individual's imported content, so re-imports can skip unchanged people."""
+    content = {key: value for key, value in payload.items() if key not in ('raw_id', 'hash')}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def parse_name(record):
+    name = record.child('NAME')
+    if name is None: return '', ''
+    if name.value:
+        parts = name.value.split('/')
+        return parts[0].strip(), parts[1].strip() if len(parts) > 1 else ''
+    return name.child_value('GIVN'), name.child_value('SURN')
+
+
+def individual_payload(record):
+    """Everything needed to write one individual, read from its streamed INDI record."""
+    first, last = parse_name(record)
+    b_date_str, b_place = record.child_value('BIRT', 'DATE'), record.child_value('BIRT', 'PLAC')
+    d_date_str, d_place = record.child_value('DEAT', 'DATE'), record.child_value('DEAT', 'PLAC')
+    facts = {}
+    for child in record.children:
+        if child.tag not in IGNORED_FACT_TAGS and child.value and child.tag not in facts: facts[child.tag] = child.value
+    payload = {
+        'raw_id': record.pointer.replace('@', ''),
+        'name': f"{first} {last}".strip() if first or last else "Unknown",
+        'gender': {'M': 'M', 'F': 'F'}.get(record.child_value('SEX').strip().upper(), 'O'),
+        'birth': (b_date_str, b_place) if b_date_str or b_place else None,
+        'death': (d_date_str, d_place) if d_date_str or d_place else None,
+        'facts': facts,
+    }
+    payload['hash'] = content_hash(payload)
+    return payload
+
+
+def family_payload(record):
+    xrefs = lambda tag: [v.replace('@', '').strip() for v in record.child_values(tag) if v.strip()]
+    return {'parents': xrefs('HUSB') + xrefs('WIFE'), 'children': xrefs('CHIL')}
+
+
+def convert_individuals(block):
+    """Parse one block of raw INDI records into (payloads, errors); runs in a worker process when importing in parallel."""
+    payloads, errors = [], []
+    for record in GedcomReader(io.BytesIO(block)).records('INDI'):
+        try:
+            payloads.append(individual_payload(record))
+        except Exception as e:
+            errors.append({'record': record.pointer, 'error': str(e)})
+    return payloads, errors
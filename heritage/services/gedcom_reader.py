@@ -0,0 +1,116 @@
+import codecs
+import re
+
+LINE_PATTERN = re.compile(r'^\s*(\d+)\s+(?:(@[^@]+@)\s+)?([A-Za-z0-9_]+)(?: (.*))?$')
+
+
+class GedcomRecord:
+    """One GEDCOM line plus its nested sub-lines."""
+    __slots__ = ('level', 'pointer', 'tag', 'value', 'children')
+
+    def __init__(self, level, pointer, tag, value):
+        self.level, self.pointer, self.tag, self.value = level, pointer, tag, value
+        self.children = []
+
+    def child(self, tag):
+        return next((c for c in self.children if c.tag == tag), None)
+
+    def child_value(self, *path):
+        """Value at a nested tag path, e.g. child_value('BIRT', 'DATE'); empty string if missing."""
+        record = self
+        for tag in path:
+            record = record.child(tag)
+            if record is None: return ''
+        return record.value
+
+    def child_values(self, tag):
+        return [c.value for c in self.children if c.tag == tag]
+
+    def __repr__(self):
+        return f"<GedcomRecord {self.level} {self.pointer or ''} {self.tag}>"
+
+
+class GedcomReader:
+    """
+    Streams level-0 records from a binary GEDCOM file one at a time, so memory
+    stays bounded by the largest single record rather than the file. A BOM is
+    dropped, CONC/CONT lines are folded into their parent's value, and a file
+    without TRLR simply ends with its last record.
+    """
+
+    def __init__(self, stream, encoding='utf-8'):
+        self.stream = stream
+        self.encoding = encoding
+
+    def _lines(self):
+        decode = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        first = True
+        for raw in self.stream:
+            line = decode.decode(raw)
+            if first:
+                line, first = line.lstrip('\ufeff'), False
+            line = line.rstrip('\r\n')
+            if line.strip(): yield line
+
+    def __iter__(self):
+        record, stack = None, []
+        for line in self._lines():
+            match = LINE_PATTERN.match(line)
+            if match is None:
+                # A stray line break inside a value: treat it as a continuation
+                if stack: stack[-1].value += '\n' + line
+                continue
+            level, pointer, tag, value = int(match.group(1)), match.group(2), match.group(3).upper(), match.group(4) or ''
+
+            if level == 0:
+                if record is not None: yield record
+                if tag == 'TRLR': return
+                record = GedcomRecord(0, pointer, tag, value)
+                stack = [record]
+                continue
+            if record is None: continue
+
+            if tag in ('CONC', 'CONT'):
+                parent = stack[min(level, len(stack)) - 1]
+                parent.value += ('\n' if tag == 'CONT' else '') + value
+                continue
+
+            del stack[level:]
+            node = GedcomRecord(level, pointer, tag, value)
+            stack[-1].children.append(node)
+            stack.append(node)
+        if record is not None: yield record
+
+    def records(self, *tags):
+        """Only the level-0 records with one of the given tags."""
+        return (r for r in self if r.tag in tags)
+
+    def blocks(self, tag, size):
+        """
+        Raw bytes of the level-0 records with a tag, `size` records per block, without
+        parsing them; each block can be read back with its own GedcomReader.
+        """
+        wanted, block, count, keep = tag.encode(), [], 0, False
+        for raw in self.stream:
+            line = raw.lstrip(codecs.BOM_UTF8).lstrip()
+            if line.startswith(b'0 '):
+                parts = line.split()
+                record_tag = parts[2] if len(parts) > 2 and parts[1].startswith(b'@') else parts[1] if len(parts) > 1 else b''
+                if record_tag == b'TRLR': break
+                keep = record_tag == wanted
+                if keep:
+                    if count == size:
+                        yield b''.join(block)
+                        block, count = [], 0
+                    count += 1
+            if keep: block.append(raw if raw.endswith(b'\n') else raw + b'\n')
+        if block: yield b''.join(block)
+
+    def count(self, tag):
+        """Count level-0 records of a tag with a cheap line scan, without building records."""
+        needle = f' {tag}'.encode()
+        total = 0
+        for raw in self.stream:
+            line = raw.rstrip(b'\r\n ').lstrip(codecs.BOM_UTF8)
+            if line.startswith(b'0 @') and line.endswith(needle): total += 1
+        return total
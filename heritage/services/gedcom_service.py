@@ -1,34 +1,38 @@
-import os
+import multiprocessing
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from django.conf import settings
 from django.db import transaction
-from gedcom.parser import Parser
-from gedcom.element.individual import IndividualElement
+from django.db.models import Q
+from django.utils import timezone
 
 from heritage.models import (
-    ImportBatch, Ancestor, AncestorFact, 
-    HeritageLocation, HeritageEvent, EventParticipation
+    ImportBatch, Ancestor, AncestorFact, AncestorRelationship,
+    HeritageEvent, EventParticipation
 )
+from heritage.signals import ancestors_changed
+from .closure import rebuild_closure
+from .data_version import bump_data_version
+from .gedcom_payload import convert_individuals, family_payload
+from .gedcom_reader import GedcomReader
+from .locations import resolve_locations
+
+BULK_CHUNK_SIZE = 500
+UPDATED_FIELDS = ['name', 'gender', 'birth_date', 'birth_year', 'birth_location', 'death_date', 'death_year', 'content_hash']
 
 class GedcomImportService:
-    def __init__(self, user):
+    def __init__(self, user, chunk_size=BULK_CHUNK_SIZE):
         self.user = user
-
-    def _sanitize_gedcom_file(self, file_path):
-        """Fixes common GEDCOM formatting issues that crash python-gedcom"""
-        with open(file_path, 'rb') as f:
-            content = f.read()
-            
-        # 1. Remove UTF-8 Byte Order Mark (BOM) if present (fixes line 1 crashes)
-        if content.startswith(b'\xef\xbb\xbf'):
-            content = content[3:]
-            
-        # 2. Ensure file ends with a proper newline (Fixes the "0 TRLR" crash)
-        # We strip any weird trailing spaces and force a clean newline
-        content = content.rstrip() + b'\r\n'
-        
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        self.chunk_size = chunk_size
+        self.locations = {}
+        self.lineage = []
+        self.existing = {}
+        self.existing_edges = None
+        self.seen_edges = set()
+        self.changed_children = set()
+        self.counts = {'created_count': 0, 'updated_count': 0, 'deleted_count': 0}
 
     def parse_gedcom_date(self, date_str):
         if not date_str: return None, None
@@ -44,72 +48,226 @@ class GedcomImportService:
             if year_match: return None, int(year_match.group())
         return None, None
 
-    def get_or_create_location(self, place_string):
-        if not place_string: return None
-        loc, _ = HeritageLocation.objects.get_or_create(name=place_string.strip(), defaults={'location_type': 'other'})
-        return loc
+    def resolve_locations(self, place_strings):
+        """Map place names to HeritageLocations with one lookup and one bulk insert per call."""
+        names = {p.strip() for p in place_strings if p and p.strip()} - self.locations.keys()
+        self.locations.update(resolve_locations(names))
+
+    def get_location(self, place_string):
+        return self.locations.get(place_string.strip()) if place_string else None
 
-    @transaction.atomic
     def process_gedcom_file(self, file_path, original_filename):
         batch = ImportBatch.objects.create(user=self.user, filename=original_filename, status='processing')
+        return self.run_import(batch, lambda: open(file_path, 'rb'))
+
+    def run_import(self, batch, open_stream):
+        """
+        Import a GEDCOM file into an existing batch, recording progress on it as chunks commit.
+        open_stream returns a fresh binary file object; the file is streamed once per pass
+        (a cheap count, individuals, then families) and never held in memory or rewritten.
+
+        A batch with a source_batch is a re-import of that family file: individuals are
+        matched by xref across the file's earlier batches, unchanged ones (same content
+        hash) are skipped, and only the inserts, updates and deletes are written. A failed
+        re-import leaves the tree partly updated and can simply be run again.
+        """
+        ImportBatch.objects.filter(pk=batch.pk).update(status='processing', started_at=timezone.now())
+        root_id = batch.source_batch_id or batch.id
+        self.lineage = list(ImportBatch.objects.filter(Q(pk=root_id) | Q(source_batch_id=root_id)).values_list('id', flat=True))
+        reimport = batch.source_batch_id is not None
         try:
-            self._sanitize_gedcom_file(file_path)
-            
-            gedcom_parser = Parser()
-            gedcom_parser.parse_file(file_path)
-            
-            for element in gedcom_parser.get_root_child_elements():
-                if isinstance(element, IndividualElement):
-                    self._process_individual(element, batch)
-                    
-            batch.status = 'completed'
-            batch.save()
+            with open_stream() as stream:
+                ImportBatch.objects.filter(pk=batch.pk).update(total_individuals=GedcomReader(stream).count('INDI'))
+
+            if reimport: self.existing = self._existing_individuals(batch)
+            processed = 0
+            with open_stream() as stream:
+                for payloads, errors in self._convert_blocks(GedcomReader(stream).blocks('INDI', self.chunk_size)):
+                    processed = self._flush(batch, payloads, errors, processed)
+
+            # Families go last so every xref they mention already has a row
+            if reimport: self.existing_edges = self._existing_edges()
+            with open_stream() as stream:
+                families = []
+                for record in GedcomReader(stream).records('FAM'):
+                    families.append(family_payload(record))
+                    if len(families) >= self.chunk_size:
+                        self._write_relationships(families, batch)
+                        families = []
+                self._write_relationships(families, batch)
+            if reimport: self._remove_stale()
+            rebuild_closure(self.changed_children)
+
+            ImportBatch.objects.filter(pk=batch.pk).update(status='completed', finished_at=timezone.now(), **self.counts)
+            batch.refresh_from_db()
             return batch
         except Exception as e:
-            batch.status = 'failed'
-            batch.save()
+            self._discard_batch(batch)
+            self._record_errors(batch, [{'record': None, 'error': str(e)}])
+            ImportBatch.objects.filter(pk=batch.pk).update(status='failed', finished_at=timezone.now())
+            batch.refresh_from_db()
             raise e
 
-    def _process_individual(self, element, batch):
-        raw_id = element.get_pointer().replace('@', '')
-        unique_id = f"gedcom_{batch.id}_{raw_id}"
-        first, last = element.get_name()
-        full_name = f"{first} {last}".strip() if first or last else "Unknown"
-        gender = {'M': 'M', 'F': 'F'}.get(element.get_gender(), 'O')
-
-        ancestor, _ = Ancestor.objects.update_or_create(
-            user=self.user, unique_id=unique_id,
-            defaults={'name': full_name, 'gender': gender, 'relation': 'Imported Relative', 'source_type': 'gedcom', 'import_batch': batch}
-        )
-        self._process_life_events_and_facts(element, ancestor)
-
-    def _process_life_events_and_facts(self, element, ancestor):
-        b_date_str, b_place, _ = element.get_birth_data()
-        if b_date_str or b_place:
-            b_date_obj, b_year = self.parse_gedcom_date(b_date_str)
-            b_loc = self.get_or_create_location(b_place)
-            ancestor.birth_date = b_date_obj
-            ancestor.birth_year = b_year
-            ancestor.birth_location = b_loc
-            ancestor.save()
-            if b_loc or b_year:
-                evt, _ = HeritageEvent.objects.get_or_create(title=f"Birth of {ancestor.name}", date_start=b_date_obj, location=b_loc, defaults={'event_type': 'personal'})
-                EventParticipation.objects.get_or_create(event=evt, ancestor=ancestor, role="Principal")
-
-        d_date_str, d_place, _ = element.get_death_data()
-        if d_date_str or d_place:
-            d_date_obj, d_year = self.parse_gedcom_date(d_date_str)
-            d_loc = self.get_or_create_location(d_place)
-            ancestor.death_date = d_date_obj
-            ancestor.death_year = d_year
-            ancestor.save()
-            if d_loc or d_year:
-                evt, _ = HeritageEvent.objects.get_or_create(title=f"Passing of {ancestor.name}", date_start=d_date_obj, location=d_loc, defaults={'event_type': 'personal'})
-                EventParticipation.objects.get_or_create(event=evt, ancestor=ancestor, role="Principal")
-
-        ignore_tags = ['BIRT', 'DEAT', 'NAME', 'SEX']
-        for child in element.get_child_elements():
-            tag = child.get_tag()
-            val = child.get_value()
-            if tag not in ignore_tags and val:
-                AncestorFact.objects.get_or_create(ancestor=ancestor, key=tag, defaults={'value': val})
\ No newline at end of file
+    def _convert_blocks(self, blocks):
+        """
+        (payloads, errors) for each block of raw INDI records, in file order. With
+        GEDCOM_IMPORT_WORKERS > 1 the parsing runs on a process pool while this
+        process stays the single writer; a few blocks are kept in flight to bound
+        memory. A solo-pool worker consuming GEDCOM_IMPORT_QUEUE can start one;
+        daemonic prefork children cannot and convert serially.
+        """
+        workers = getattr(settings, 'GEDCOM_IMPORT_WORKERS', 0)
+        if workers > 1 and multiprocessing.current_process().daemon:
+            print("GEDCOM_IMPORT_WORKERS ignored in a daemonic process; set GEDCOM_IMPORT_QUEUE and consume it with --pool=solo")
+            workers = 0
+        if workers <= 1:
+            yield from map(convert_individuals, blocks)
+            return
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pending = deque()
+            for block in blocks:
+                pending.append(pool.submit(convert_individuals, block))
+                if len(pending) >= workers * 2: yield pending.popleft().result()
+            while pending: yield pending.popleft().result()
+
+    def _existing_individuals(self, batch):
+        """xref -> (ancestor id, content hash) for everything earlier imports of this file created."""
+        rows = Ancestor.objects.filter(import_batch__in=self.lineage).exclude(import_batch=batch)
+        return {xref: (ancestor_id, digest) for xref, ancestor_id, digest in rows.values_list('gedcom_xref', 'id', 'content_hash')}
+
+    def _existing_edges(self):
+        rows = AncestorRelationship.objects.filter(from_ancestor__import_batch__in=self.lineage, to_ancestor__import_batch__in=self.lineage)
+        return {(a, b, kind): pk for pk, a, b, kind in rows.values_list('id', 'from_ancestor_id', 'to_ancestor_id', 'relationship_type')}
+
+    def _flush(self, batch, payloads, errors, processed):
+        """Write one chunk and advance the batch's progress counter."""
+        created, updated = [], []
+        for p in payloads:
+            known = self.existing.pop(p['raw_id'], None)
+            if known is None: created.append(p)
+            elif known[1] != p['hash']: updated.append((known[0], p))
+        if created: self._write_individuals(created, batch)
+        if updated: self._update_individuals(updated, batch)
+        self.counts['created_count'] += len(created)
+        self.counts['updated_count'] += len(updated)
+        self._record_errors(batch, errors)
+        processed += len(payloads) + len(errors)
+        ImportBatch.objects.filter(pk=batch.pk).update(processed_individuals=processed)
+        return processed
+
+    def _remove_stale(self):
+        """Drop the edges and individuals an earlier import created that the new file no longer has."""
+        # Row deletes fire the closure and data-version signals for what they touch
+        stale_edges = [pk for edge, pk in self.existing_edges.items() if edge not in self.seen_edges]
+        AncestorRelationship.objects.filter(pk__in=stale_edges).delete()
+        removed = [ancestor_id for ancestor_id, _ in self.existing.values()]
+        if not removed: return
+        HeritageEvent.objects.filter(import_batch__in=self.lineage, participants__ancestor_id__in=removed).delete()
+        Ancestor.objects.filter(id__in=removed).delete()
+        self.counts['deleted_count'] += len(removed)
+
+    def _record_errors(self, batch, errors):
+        if not errors: return
+        batch.refresh_from_db(fields=['errors', 'error_count'])
+        batch.errors = (batch.errors + errors)[:ImportBatch.MAX_STORED_ERRORS]
+        batch.error_count += len(errors)
+        batch.save(update_fields=['errors', 'error_count'])
+
+    @transaction.atomic
+    def _write_relationships(self, families, batch):
+        """Turn one chunk of FAM records into parent and spouse edges with a single lookup and bulk insert."""
+        raw_ids = {raw_id for f in families for raw_id in f['parents'] + f['children']}
+        if not raw_ids: return
+        ids = dict(Ancestor.objects.filter(import_batch__in=self.lineage, gedcom_xref__in=raw_ids).values_list('gedcom_xref', 'id'))
+        resolve = lambda raw_ids: [ids[r] for r in raw_ids if r in ids]
+
+        edges = set()
+        for family in families:
+            parents, children = resolve(family['parents']), resolve(family['children'])
+            edges.update((parent, child, 'parent') for parent in parents for child in children if parent != child)
+            edges.update((a, b, 'spouse') for a in parents for b in parents if a < b)
+        if self.existing_edges is not None:
+            self.seen_edges |= edges
+            edges -= self.existing_edges.keys()
+        AncestorRelationship.objects.bulk_create([
+            AncestorRelationship(user=self.user, from_ancestor_id=a, to_ancestor_id=b, relationship_type=kind, import_batch=batch)
+            for a, b, kind in edges
+        ], ignore_conflicts=True)
+        self.changed_children.update(child for _, child, kind in edges if kind == 'parent')
+        if edges: bump_data_version([self.user.id])
+
+    def _apply_payload(self, ancestor, p):
+        """Set an ancestor's imported fields from a payload; returns its life events to create."""
+        ancestor.name, ancestor.gender, ancestor.content_hash = p['name'], p['gender'], p['hash']
+        ancestor.birth_date = ancestor.birth_year = ancestor.birth_location = ancestor.death_date = ancestor.death_year = None
+        life_events = []
+        if p['birth']:
+            b_date_obj, b_year = self.parse_gedcom_date(p['birth'][0])
+            b_loc = self.get_location(p['birth'][1])
+            ancestor.birth_date, ancestor.birth_year, ancestor.birth_location = b_date_obj, b_year, b_loc
+            if b_loc or b_year: life_events.append((ancestor, f"Birth of {ancestor.name}", b_date_obj, b_loc))
+        if p['death']:
+            d_date_obj, d_year = self.parse_gedcom_date(p['death'][0])
+            d_loc = self.get_location(p['death'][1])
+            ancestor.death_date, ancestor.death_year = d_date_obj, d_year
+            if d_loc or d_year: life_events.append((ancestor, f"Passing of {ancestor.name}", d_date_obj, d_loc))
+        return life_events
+
+    def _write_details(self, ancestors, payloads, life_events, batch):
+        events = HeritageEvent.objects.bulk_create([
+            HeritageEvent(title=title, date_start=date, location=loc, event_type='personal', import_batch=batch)
+            for _, title, date, loc in life_events
+        ])
+        EventParticipation.objects.bulk_create([
+            EventParticipation(event=event, ancestor=ancestor, role="Principal")
+            for event, (ancestor, _, _, _) in zip(events, life_events)
+        ])
+        AncestorFact.objects.bulk_create([
+            AncestorFact(ancestor=ancestor, key=key, value=value, import_batch=batch)
+            for ancestor, p in zip(ancestors, payloads) for key, value in p['facts'].items()
+        ])
+
+    @transaction.atomic
+    def _write_individuals(self, payloads, batch):
+        """Write one chunk of individuals with a bulk insert per table, in its own transaction."""
+        self.resolve_locations([life_event[1] for p in payloads for life_event in (p['birth'], p['death']) if life_event])
+
+        ancestors, life_events = [], []
+        for p in payloads:
+            ancestor = Ancestor(
+                user=self.user, unique_id=f"gedcom_{batch.id}_{p['raw_id']}", gedcom_xref=p['raw_id'],
+                relation='Imported Relative', source_type='gedcom', import_batch=batch
+            )
+            life_events += self._apply_payload(ancestor, p)
+            ancestors.append(ancestor)
+        Ancestor.objects.bulk_create(ancestors)
+        self._write_details(ancestors, payloads, life_events, batch)
+        ancestors_changed.send(sender=Ancestor, user=self.user, ancestor_ids=[a.id for a in ancestors], bulk=True)
+
+    @transaction.atomic
+    def _update_individuals(self, updates, batch):
+        """
+        Rewrite changed individuals in place: one bulk update, then the facts and life
+        events earlier imports of this file wrote replaced. Rows added by hand or by the
+        interview are left alone.
+        """
+        payloads = [p for _, p in updates]
+        self.resolve_locations([life_event[1] for p in payloads for life_event in (p['birth'], p['death']) if life_event])
+
+        by_id = Ancestor.objects.in_bulk([ancestor_id for ancestor_id, _ in updates])
+        ancestors, life_events = [], []
+        for ancestor_id, p in updates:
+            ancestor = by_id[ancestor_id]
+            life_events += self._apply_payload(ancestor, p)
+            ancestors.append(ancestor)
+        Ancestor.objects.bulk_update(ancestors, UPDATED_FIELDS)
+
+        AncestorFact.objects.filter(ancestor__in=ancestors, import_batch__in=self.lineage).delete()
+        HeritageEvent.objects.filter(import_batch__in=self.lineage, participants__ancestor__in=ancestors).delete()
+        self._write_details(ancestors, payloads, life_events, batch)
+        ancestors_changed.send(sender=Ancestor, user=self.user, ancestor_ids=[a.id for a in ancestors], bulk=True)
+
+    def _discard_batch(self, batch):
+        """Remove whatever earlier chunks of a failed import already committed."""
+        HeritageEvent.objects.filter(participants__ancestor__import_batch=batch).delete()
+        Ancestor.objects.filter(import_batch=batch).delete()
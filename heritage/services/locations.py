@@ -0,0 +1,15 @@
+from heritage.models import HeritageLocation
+
+
+def resolve_locations(names):
+    """{name: HeritageLocation} for the given place names, with one lookup and one bulk insert for the missing ones."""
+    names = {name for name in names if name}
+    if not names: return {}
+    locations = {}
+    # Descending so the oldest row wins when a name has duplicates
+    for loc in HeritageLocation.objects.filter(name__in=names).order_by('-id'):
+        locations[loc.name] = loc
+    missing = names - locations.keys()
+    for loc in HeritageLocation.objects.bulk_create([HeritageLocation(name=name, location_type='other') for name in missing]):
+        locations[loc.name] = loc
+    return locations
@@ -0,0 +1,41 @@
+import re
+
+PARENT_WORDS = {'father': 'paternal', 'dad': 'paternal', 'mother': 'maternal', 'mom': 'maternal', 'mum': 'maternal', 'parent': None}
+SELF_WORDS = {'self', 'me', 'myself', 'user'}
+ORDINAL_GREATS = re.compile(r'(\d+)\s*(?:st|nd|rd|th|x)?\s*great')
+POSSESSIVE = re.compile(r"'s\s+")
+
+
+def _parse_segment(segment):
+    words = re.findall(r'[a-z]+', segment)
+    if not words: return None, None
+    if set(words) & SELF_WORDS and 'grand' not in segment: return 0, None
+    if 'law' in words or any(w.startswith('god') for w in words): return None, None
+    parent_word = next((w for w in PARENT_WORDS if w in segment), None)
+    if parent_word is None: return None, None
+
+    ordinal = ORDINAL_GREATS.search(segment)
+    greats = int(ordinal.group(1)) if ordinal else segment.count('great')
+    side = 'paternal' if 'paternal' in segment else 'maternal' if 'maternal' in segment else None
+    if 'grand' in segment: return 2 + greats, side
+    return 1 + greats, side or PARENT_WORDS[parent_word]
+
+
+def parse_relation(relation):
+    """
+    Turn a free-text relation ("Paternal Grandmother", "2nd great grandfather",
+    "father's mother") into (generations above the user, paternal/maternal side).
+    Unknown relations give (None, None).
+    """
+    if not relation: return None, None
+    text = relation.lower().strip()
+    segments = POSSESSIVE.split(text)
+    if len(segments) == 1: return _parse_segment(text)
+
+    generation, side = 0, None
+    for segment in segments:
+        segment_generation, segment_side = _parse_segment(segment)
+        if not segment_generation: return None, None
+        generation += segment_generation
+        side = side or segment_side
+    return generation, side
@@ -0,0 +1,209 @@
+import re
+from datetime import datetime
+from functools import reduce
+from operator import or_
+from django.db.models import Q
+
+from heritage.models import Ancestor, AncestorFact, Story, HeritageEvent, EventParticipation
+from heritage.signals import ancestors_changed
+from .locations import resolve_locations
+
+TAG_PATTERN = re.compile(r'\[(PERSON|FACT|DATA|EVENT|STORY):([^\]]+)\]')
+TAG_OPENINGS = tuple(f"[{name}:" for name in ('PERSON', 'FACT', 'DATA', 'EVENT', 'STORY'))
+PERSON_FIELDS = ['name', 'relation', 'gender', 'origin', 'birth_location', 'birth_year']
+# The only profile fields the interview prompt asks the model to tag
+USER_DATA_FIELDS = {'first_name', 'last_name'}
+
+
+def parse_key_value_pairs(s):
+    pairs = {}
+    for item in s.split(','):
+        if '=' in item:
+            k, v = item.split('=', 1)
+            pairs[k.strip()] = v.strip()
+    return pairs
+
+
+def extract_tags(text):
+    """Strip the AI tags out of a response in one pass; returns (cleaned_text, [(tag_type, attrs)])."""
+    tags = []
+    def collect(match):
+        tags.append((match.group(1), parse_key_value_pairs(match.group(2))))
+        return ''
+    return TAG_PATTERN.sub(collect, text).strip(), tags
+
+
+class TagStreamFilter:
+    """
+    Hides tags from a reply streamed in arbitrary chunks. Text is released as
+    soon as it cannot be part of a tag; a possible tag is held back until its
+    closing bracket shows whether it is one.
+    """
+
+    def __init__(self):
+        self.pending = ''
+
+    def feed(self, chunk):
+        """Add a chunk and return the text that is now safe to show."""
+        self.pending += chunk
+        visible = []
+        while self.pending:
+            start = self.pending.find('[')
+            if start < 0:
+                visible.append(self.pending)
+                self.pending = ''
+            elif start > 0:
+                visible.append(self.pending[:start])
+                self.pending = self.pending[start:]
+            elif self.pending.startswith(TAG_OPENINGS):
+                end = self.pending.find(']')
+                if end < 0: break
+                if not TAG_PATTERN.fullmatch(self.pending[:end + 1]): visible.append(self.pending[:end + 1])
+                self.pending = self.pending[end + 1:]
+            elif any(opening.startswith(self.pending) for opening in TAG_OPENINGS):
+                break
+            else:
+                visible.append('[')
+                self.pending = self.pending[1:]
+        return ''.join(visible)
+
+    def flush(self):
+        """Whatever is still held back once the stream ends, such as an unclosed tag."""
+        rest, self.pending = self.pending, ''
+        return rest
+
+
+def parse_date(date_str):
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
+    except ValueError:
+        return None
+
+
+class TagWriter:
+    """
+    Persists a batch of extracted tags for one user. Referenced ancestors,
+    locations, events and story subjects are each resolved with a single
+    query, and every table is written with bulk operations.
+    """
+
+    def __init__(self, user, profile):
+        self.user = user
+        self.profile = profile
+
+    def write(self, tags):
+        extracted = {"persons": [], "events": [], "facts": [], "user_data": [], "stories": []}
+        by_type = {'PERSON': [], 'FACT': [], 'DATA': [], 'EVENT': [], 'STORY': []}
+        for tag_type, attrs in tags: by_type[tag_type].append(attrs)
+
+        self.write_user_data(by_type['DATA'], extracted)
+        locations = resolve_locations(
+            [attrs.get('birth_place') for attrs in by_type['PERSON']] + [attrs.get('location') for attrs in by_type['EVENT']]
+        )
+        person_ids = {attrs.get('id') for attrs in by_type['PERSON']} | {attrs.get('person_id') for attrs in by_type['FACT'] + by_type['EVENT']}
+        ancestors = {}
+        for ancestor in Ancestor.objects.filter(user=self.user, unique_id__in=person_ids - {None, ''}).order_by('-id'):
+            ancestors[ancestor.unique_id] = ancestor
+
+        changed = self.write_persons(by_type['PERSON'], ancestors, locations, extracted)
+        changed |= self.write_events(by_type['EVENT'], ancestors, locations, extracted)
+        self.write_facts(by_type['FACT'], ancestors, extracted)
+        self.write_stories(by_type['STORY'], extracted)
+
+        if any(extracted.values()):
+            ancestors_changed.send(sender=Ancestor, user=self.user, ancestor_ids=changed, bulk=True)
+        return extracted
+
+    def write_user_data(self, tags, extracted):
+        updated = []
+        for attrs in tags:
+            key, value = attrs.get('key'), attrs.get('value')
+            if key in USER_DATA_FIELDS and value:
+                value = value[:self.profile._meta.get_field(key).max_length]
+                setattr(self.profile, key, value)
+                updated.append(key)
+                extracted['user_data'].append({key: value})
+        if updated: self.profile.save(update_fields=set(updated))
+
+    def write_persons(self, tags, ancestors, locations, extracted):
+        """Create or update the tagged people; returns the ancestor ids written."""
+        created, updated = {}, {}
+        for attrs in tags:
+            person_id = attrs.get('id')
+            if not person_id: continue
+            ancestor = ancestors.get(person_id) or Ancestor(user=self.user, unique_id=person_id)
+            ancestor.name, ancestor.relation = attrs.get('name', ''), attrs.get('relation', '')
+            ancestor.gender, ancestor.origin = attrs.get('gender', ''), attrs.get('origin', '')
+            ancestor.birth_location = locations.get(attrs.get('birth_place'))
+            if attrs.get('birth_year', '').isdigit(): ancestor.birth_year = int(attrs['birth_year'])
+            ancestors[person_id] = ancestor
+            (updated if ancestor.pk else created)[person_id] = ancestor
+            extracted['persons'].append({'id': person_id, 'name': ancestor.name})
+        Ancestor.objects.bulk_create(created.values())
+        if updated: Ancestor.objects.bulk_update(updated.values(), PERSON_FIELDS)
+        return {a.id for a in list(created.values()) + list(updated.values())}
+
+    def write_events(self, tags, ancestors, locations, extracted):
+        """Get-or-create the tagged events and link their people; returns the ids of ancestors whose birth date changed."""
+        wanted = {}
+        for attrs in tags:
+            if attrs.get('title'): wanted.setdefault((attrs['title'], parse_date(attrs.get('date'))), attrs)
+        if not wanted: return set()
+
+        events = {}
+        for event in HeritageEvent.objects.filter(reduce(or_, (Q(title=title, date_start=date) for title, date in wanted))).order_by('-id'):
+            events[(event.title, event.date_start)] = event
+        missing = [key for key in wanted if key not in events]
+        for key, event in zip(missing, HeritageEvent.objects.bulk_create([
+            HeritageEvent(title=title, date_start=date, location=locations.get(wanted[(title, date)].get('location')), event_type=wanted[(title, date)].get('type', 'personal'))
+            for title, date in missing
+        ])):
+            events[key] = event
+
+        links, changed = {}, {}
+        for attrs in tags:
+            if not attrs.get('title'): continue
+            key = (attrs['title'], parse_date(attrs.get('date')))
+            ancestor = ancestors.get(attrs.get('person_id'))
+            if ancestor:
+                links[(events[key].id, ancestor.id)] = (events[key], ancestor)
+                if 'birth' in key[0].lower() and key[1]:
+                    ancestor.birth_date, ancestor.birth_year = key[1], key[1].year
+                    changed[ancestor.id] = ancestor
+            extracted['events'].append({'title': attrs['title'], 'date': attrs.get('date')})
+
+        existing = set(EventParticipation.objects.filter(
+            event__in=[event for event, _ in links.values()], ancestor__in=[ancestor for _, ancestor in links.values()]
+        ).values_list('event_id', 'ancestor_id'))
+        EventParticipation.objects.bulk_create([
+            EventParticipation(event=event, ancestor=ancestor, role='Principal')
+            for key, (event, ancestor) in links.items() if key not in existing
+        ])
+        if changed: Ancestor.objects.bulk_update(changed.values(), ['birth_date', 'birth_year'])
+        return set(changed)
+
+    def write_facts(self, tags, ancestors, extracted):
+        facts = []
+        for attrs in tags:
+            person_id, key, value = attrs.get('person_id'), attrs.get('key'), attrs.get('value')
+            if person_id in ancestors and key and value:
+                facts.append(AncestorFact(ancestor=ancestors[person_id], key=key, value=value))
+                extracted['facts'].append({'person': person_id, 'key': key})
+        AncestorFact.objects.bulk_create(facts)
+
+    def write_stories(self, tags, extracted):
+        tags = [attrs for attrs in tags if attrs.get('content')]
+        names = {attrs['ancestor_name'] for attrs in tags if attrs.get('ancestor_name')}
+        candidates = []
+        if names:
+            candidates = list(Ancestor.objects.filter(reduce(or_, (Q(name__icontains=n) for n in names)), user=self.user).order_by('id').only('id', 'name'))
+
+        stories = []
+        for attrs in tags:
+            name = attrs.get('ancestor_name')
+            ancestor = next((a for a in candidates if name and name.lower() in a.name.lower()), None)
+            # Story.ancestor is required, so stories about unknown people are dropped
+            if ancestor is None: continue
+            stories.append(Story(user=self.user, ancestor=ancestor, content=attrs['content'], context=attrs.get('context', '')))
+            extracted['stories'].append({'ancestor': name, 'context': attrs.get('context', '')})
+        Story.objects.bulk_create(stories)
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Ancestor, AncestorFact, AncestorRelationship, Story, MediaTag, HeritageEvent, EventParticipation
+from .services.closure import rebuild_closure
+from .services.data_version import bump_data_version
+
+# Sent after a code path creates or updates ancestors, including bulk writes
+# that bypass post_save. Receivers get `user` and `ancestor_ids`.
+ancestors_changed = Signal()
+
+
+@receiver(ancestors_changed)
+def bump_version_for_changed_ancestors(sender, user, **kwargs):
+    bump_data_version([user.id])
+
+
+@receiver([post_save, post_delete], sender=Ancestor)
+@receiver([post_save, post_delete], sender=Story)
+@receiver([post_save, post_delete], sender=AncestorRelationship)
+def bump_version_for_owner(sender, instance, signal, raw=False, **kwargs):
+    if raw: return
+    bump_data_version([instance.user_id], create=signal is post_save)
+
+
+@receiver([post_save, post_delete], sender=AncestorFact)
+@receiver([post_save, post_delete], sender=MediaTag)
+@receiver([post_save, post_delete], sender=EventParticipation)
+def bump_version_for_ancestor_owner(sender, instance, signal, raw=False, **kwargs):
+    if raw: return
+    bump_data_version(Ancestor.objects.filter(id=instance.ancestor_id).values_list('user_id', flat=True), create=signal is post_save)
+
+
+@receiver(post_save, sender=HeritageEvent)
+def bump_version_for_event_participants(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created: return
+    bump_data_version(Ancestor.objects.filter(events__event=instance).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=AncestorRelationship)
+def add_edge_to_closure(sender, instance, raw=False, **kwargs):
+    if raw or instance.relationship_type != 'parent': return
+    rebuild_closure([instance.to_ancestor_id])
+
+
+@receiver(post_delete, sender=AncestorRelationship)
+def remove_edge_from_closure(sender, instance, **kwargs):
+    # Deferred so an ancestor delete cascading into its edges has finished first
+    if instance.relationship_type != 'parent': return
+    transaction.on_commit(lambda: rebuild_closure([instance.to_ancestor_id]))
@@ -0,0 +1,37 @@
+from celery import shared_task
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ImportBatch
+from .services.gedcom_service import GedcomImportService
+
+
+@shared_task(ignore_result=True)
+def import_gedcom_batch(batch_id):
+    """
+    Background task to import a staged GEDCOM upload. Progress is written to
+    the ImportBatch as each chunk commits, so no task result is stored.
+    """
+    try:
+        batch = ImportBatch.objects.select_related('user').get(id=batch_id)
+    except ImportBatch.DoesNotExist:
+        return f"Import batch {batch_id} not found"
+
+    staged_file = batch.staged_file
+    try:
+        if not staged_file: raise FileNotFoundError("No staged GEDCOM file for this batch")
+        # Streamed straight from storage; the importer reopens it for each pass
+        batch = GedcomImportService(batch.user).run_import(batch, lambda: default_storage.open(staged_file, 'rb'))
+        return f"Imported {batch.processed_individuals} individuals for batch {batch_id}"
+    except Exception as e:
+        # run_import marks its own failures; this catches a batch it never got to, or could not clean up
+        ImportBatch.objects.filter(pk=batch_id, status__in=['queued', 'processing']).update(
+            status='failed', finished_at=timezone.now(), errors=[{'record': None, 'error': str(e)}], error_count=F('error_count') + 1
+        )
+        return f"Error importing batch {batch_id}: {str(e)}"
+    finally:
+        try:
+            if staged_file: default_storage.delete(staged_file)
+        except Exception as e:
+            print(f"Error deleting staged GEDCOM file {staged_file}: {e}")
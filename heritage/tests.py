@@ -1,3 +1,286 @@
-from django.test import TestCase
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+
+from .models import Ancestor, AncestorClosure, AncestorFact, AncestorRelationship, EventParticipation, HeritageEvent, ImportBatch, UserProfile
+from .services.gedcom_export import GedcomExportService
+from .services.gedcom_reader import GedcomReader
+from .services.gedcom_service import GedcomImportService
+from .services.relations import parse_relation
+from .services.tag_extraction import TAG_PATTERN, TagStreamFilter, TagWriter, extract_tags
+from .tasks import import_gedcom_batch
+
+FAMILY_FILE = b"""0 HEAD
+0 @I1@ INDI
+1 NAME Olaf /Haraldsson/
+1 SEX M
+1 BIRT
+2 DATE 12 MAR 1850
+2 PLAC Gimli
+1 OCCU Fisherman
+0 @I2@ INDI
+1 NAME Ingrid /Jonsdottir/
+1 SEX F
+0 @I3@ INDI
+1 NAME Bjorn /Olafsson/
+1 SEX M
+0 @F1@ FAM
+1 HUSB @I1@
+1 WIFE @I2@
+1 CHIL @I3@
+0 TRLR
+"""
+
+
+def import_file(user, data, source_batch=None):
+    batch = ImportBatch.objects.create(user=user, filename='family.ged', status='queued', source_batch=source_batch)
+    return GedcomImportService(user).run_import(batch, lambda: io.BytesIO(data))
+
+
+class ClosureTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='family')
+        self.people = {
+            name: Ancestor.objects.create(user=self.user, unique_id=name, name=name, relation='Relative')
+            for name in ('harald', 'olaf', 'bjorn', 'sigrid')
+        }
+
+    def link(self, parent, child):
+        return AncestorRelationship.objects.create(
+            user=self.user, from_ancestor=self.people[parent], to_ancestor=self.people[child], relationship_type='parent'
+        )
+
+    def closure(self):
+        names = {a.id: name for name, a in self.people.items()}
+        return {(names[a], names[d], depth) for a, d, depth in AncestorClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')}
+
+    def test_adding_an_edge_above_extends_the_whole_subtree(self):
+        self.link('olaf', 'bjorn')
+        self.link('bjorn', 'sigrid')
+        self.link('harald', 'olaf')
+
+        self.assertEqual(self.closure(), {
+            ('olaf', 'bjorn', 1), ('bjorn', 'sigrid', 1), ('olaf', 'sigrid', 2),
+            ('harald', 'olaf', 1), ('harald', 'bjorn', 2), ('harald', 'sigrid', 3),
+        })
+
+    def test_shortest_depth_is_kept_for_two_paths(self):
+        self.link('harald', 'olaf')
+        self.link('olaf', 'bjorn')
+        self.link('harald', 'bjorn')
+
+        self.assertIn(('harald', 'bjorn', 1), self.closure())
+        self.assertNotIn(('harald', 'bjorn', 2), self.closure())
+
+    def test_deleting_an_edge_cuts_the_subtree_off(self):
+        self.link('harald', 'olaf')
+        middle = self.link('olaf', 'bjorn')
+        self.link('bjorn', 'sigrid')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            middle.delete()
+
+        self.assertEqual(self.closure(), {('harald', 'olaf', 1), ('bjorn', 'sigrid', 1)})
+
+
+class GedcomReaderTests(SimpleTestCase):
+    # Starts with a UTF-8 BOM, uses CRLF line ends and never reaches a TRLR line
+    DATA = (
+        b"\xef\xbb\xbf0 HEAD\r\n0 @I1@ INDI\r\n1 NAME Gu\xc3\xb0r\xc3\xban /J\xc3\xb3nsd\xc3\xb3ttir/\r\n"
+        b"1 NOTE Came to Gimli\r\n2 CONC  in 1876\r\n2 CONT and farmed.\r\n1 BIRT\r\n2 DATE 1 JAN 1850\r\n"
+        b"0 @F1@ FAM\r\n1 WIFE @I1@\r\n1 CHIL @I2@\r\n0 @I2@ INDI\r\n1 NAME Anna /Jonsdottir/"
+    )
+
+    def reader(self):
+        return GedcomReader(io.BytesIO(self.DATA))
+
+    def test_records_survive_bom_continuations_and_missing_trailer(self):
+        records = list(self.reader())
+
+        self.assertEqual([(r.tag, r.pointer) for r in records], [('HEAD', None), ('INDI', '@I1@'), ('FAM', '@F1@'), ('INDI', '@I2@')])
+        self.assertEqual(records[1].child_value('NAME'), 'Guðrún /Jónsdóttir/')
+        self.assertEqual(records[1].child_value('NOTE'), 'Came to Gimli in 1876\nand farmed.')
+        self.assertEqual(records[1].child_value('BIRT', 'DATE'), '1 JAN 1850')
+        self.assertEqual(records[3].child_value('NAME'), 'Anna /Jonsdottir/')
+
+    def test_count_and_blocks_agree_with_records(self):
+        self.assertEqual(self.reader().count('INDI'), 2)
+        blocks = list(self.reader().blocks('INDI', 1))
+        self.assertEqual(len(blocks), 2)
+        self.assertEqual([r.pointer for block in blocks for r in GedcomReader(io.BytesIO(block))], ['@I1@', '@I2@'])
+
+    def test_trailer_ends_the_stream(self):
+        data = b"0 @I1@ INDI\n1 NAME A /B/\n0 TRLR\n0 @I2@ INDI\n"
+        self.assertEqual([r.pointer for r in GedcomReader(io.BytesIO(data)).records('INDI')], ['@I1@'])
+
+
+class GedcomReimportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='importer')
+        self.first = import_file(self.user, FAMILY_FILE)
+        self.olaf = Ancestor.objects.get(user=self.user, gedcom_xref='I1')
+
+    def test_reimport_keeps_facts_and_events_not_written_by_the_import(self):
+        AncestorFact.objects.create(ancestor=self.olaf, key='Nickname', value='Old Olaf')
+        event = HeritageEvent.objects.create(title='Birth of Olaf Haraldsson', description='Told by grandmother')
+        EventParticipation.objects.create(event=event, ancestor=self.olaf, role='Principal')
+
+        edited = FAMILY_FILE.replace(b'1 OCCU Fisherman', b'1 OCCU Farmer').replace(b'1850', b'1851')
+        batch = import_file(self.user, edited, source_batch=self.first)
+
+        self.assertEqual(batch.updated_count, 1)
+        facts = dict(self.olaf.facts.values_list('key', 'value'))
+        self.assertEqual(facts, {'OCCU': 'Farmer', 'Nickname': 'Old Olaf'})
+        self.assertTrue(HeritageEvent.objects.filter(pk=event.pk).exists())
+        imported = HeritageEvent.objects.filter(participants__ancestor=self.olaf, import_batch__isnull=False)
+        self.assertEqual([e.date_start.year for e in imported], [1851])
+
+    def test_reimport_counts_created_updated_and_deleted_people(self):
+        edited = (
+            FAMILY_FILE.replace(b'1 OCCU Fisherman', b'1 OCCU Farmer')
+            .replace(b'0 @I3@ INDI\n1 NAME Bjorn /Olafsson/\n1 SEX M\n', b'0 @I4@ INDI\n1 NAME Sigrid /Olafsdottir/\n1 SEX F\n')
+            .replace(b'1 CHIL @I3@', b'1 CHIL @I4@')
+        )
+        batch = import_file(self.user, edited, source_batch=self.first)
+
+        self.assertEqual((batch.status, batch.created_count, batch.updated_count, batch.deleted_count), ('completed', 1, 1, 1))
+        self.assertEqual(sorted(Ancestor.objects.filter(user=self.user).values_list('gedcom_xref', flat=True)), ['I1', 'I2', 'I4'])
+        children = AncestorRelationship.objects.filter(user=self.user, relationship_type='parent').values_list('to_ancestor__gedcom_xref', flat=True)
+        self.assertEqual(set(children), {'I4'})
+
+        again = import_file(self.user, edited, source_batch=self.first)
+        self.assertEqual((again.created_count, again.updated_count, again.deleted_count), (0, 0, 0))
+
+
+class GedcomExportTests(TestCase):
+    def test_export_reads_back_with_links_continuations_and_valid_tags(self):
+        user = User.objects.create(username='exporter')
+        import_file(user, FAMILY_FILE)
+        olaf = Ancestor.objects.get(user=user, gedcom_xref='I1')
+        note = 'Fished off Hecla Island. ' * 12 + '\nKept the boat until 1902.'
+        for key, value in (('NICKNAME', 'Old Olaf'), ('Boat name', 'Sigrid'), ('_UID', 'ABC123'), ('NOTE', note)):
+            AncestorFact.objects.create(ancestor=olaf, key=key, value=value)
+
+        exported = ''.join(GedcomExportService(user).stream())
+        records = list(GedcomReader(io.BytesIO(exported.encode())))
+
+        self.assertIn('2 CONC ', exported)
+        self.assertIn('2 CONT Kept the boat until 1902.', exported)
+        people = {r.child_value('NAME'): r for r in records if r.tag == 'INDI'}
+        self.assertEqual(set(people), {'Olaf /Haraldsson/', 'Ingrid /Jonsdottir/', 'Bjorn /Olafsson/'})
+        olaf_record = people['Olaf /Haraldsson/']
+        self.assertEqual(olaf_record.child_value('NOTE'), note)
+        self.assertEqual(olaf_record.child_value('OCCU'), 'Fisherman')
+        self.assertEqual(olaf_record.child_value('_UID'), 'ABC123')
+        self.assertNotIn('NICKNAME', [c.tag for c in olaf_record.children])
+        facts = {c.child_value('TYPE'): c.value for c in olaf_record.children if c.tag == 'FACT'}
+        self.assertEqual(facts, {'NICKNAME': 'Old Olaf', 'Boat name': 'Sigrid'})
+
+        [family] = [r for r in records if r.tag == 'FAM']
+        self.assertEqual(family.child_value('HUSB'), olaf_record.pointer)
+        self.assertEqual(family.child_value('WIFE'), people['Ingrid /Jonsdottir/'].pointer)
+        self.assertEqual(family.child_values('CHIL'), [people['Bjorn /Olafsson/'].pointer])
+        self.assertEqual(olaf_record.child_values('FAMS'), [family.pointer])
+        self.assertEqual(people['Ingrid /Jonsdottir/'].child_values('FAMS'), [family.pointer])
+        self.assertEqual(people['Bjorn /Olafsson/'].child_values('FAMC'), [family.pointer])
+
+
+class ImportTaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='uploader')
+
+    def run_task(self, staged_file):
+        batch = ImportBatch.objects.create(user=self.user, filename='family.ged', status='queued', staged_file=staged_file)
+        import_gedcom_batch(batch.id)
+        batch.refresh_from_db()
+        return batch
+
+    def test_missing_staged_file_fails_the_batch(self):
+        batch = self.run_task('gedcom_staging/missing.ged')
+        self.assertEqual(batch.status, 'failed')
+        self.assertIn('missing.ged', batch.errors[0]['error'])
+
+        self.assertEqual(self.run_task('').status, 'failed')
+
+    def test_batch_fails_even_if_the_importer_cannot_clean_up(self):
+        with mock.patch.object(GedcomImportService, '_discard_batch', side_effect=RuntimeError('database went away')):
+            batch = self.run_task('gedcom_staging/missing.ged')
+        self.assertEqual((batch.status, batch.errors[0]['error']), ('failed', 'database went away'))
+
+    def test_upload_fails_fast_when_the_import_cannot_be_queued(self):
+        with mock.patch.object(import_gedcom_batch, 'apply_async', side_effect=ConnectionError('broker down')) as apply_async:
+            response = self.client.post('/api/heritage/upload-gedcom/', {'file': SimpleUploadedFile('family.ged', FAMILY_FILE)})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(apply_async.call_args.kwargs, {'retry': False})
+        batch = ImportBatch.objects.get(pk=response.json()['batch_id'])
+        self.assertEqual(batch.status, 'failed')
+        self.assertIn('broker down', batch.errors[0]['error'])
+        self.assertFalse(default_storage.exists(batch.staged_file))
+        self.assertFalse(Ancestor.objects.exists())
+
+
+class TagStreamFilterTests(SimpleTestCase):
+    REPLY = "Hail [Olaf]! [PERSON:id=p1, name=Olaf, relation=Father] He fished [a lot]. [FACT:person_id=p1, key=Job, value=Fisher]"
+
+    def stream(self, chunks):
+        tags = TagStreamFilter()
+        return [tags.feed(chunk) for chunk in chunks] + [tags.flush()]
+
+    def test_tags_split_anywhere_across_chunks_are_hidden(self):
+        expected = TAG_PATTERN.sub('', self.REPLY)
+        for i in range(len(self.REPLY)):
+            for j in range(i, len(self.REPLY)):
+                chunks = [self.REPLY[:i], self.REPLY[i:j], self.REPLY[j:]]
+                with self.subTest(chunks=chunks):
+                    self.assertEqual(''.join(self.stream(chunks)), expected)
+
+    def test_text_is_released_as_soon_as_it_cannot_be_a_tag(self):
+        self.assertEqual(self.stream(['Hello [PER', 'SON:id=p1]', ' there [x', ']']), ['Hello ', '', ' there [x', ']', ''])
+
+    def test_unclosed_tag_is_flushed_at_the_end(self):
+        self.assertEqual(self.stream(['Bye [STORY:content=unfinished']), ['Bye ', '[STORY:content=unfinished'])
+
+
+class TagWriterTests(TestCase):
+    def test_data_tags_only_set_the_names_the_prompt_asks_for(self):
+        user = User.objects.create(username='interviewee')
+        profile = UserProfile.objects.create(user=user, data_version=3)
+        _, tags = extract_tags(
+            "Nice to meet you! [DATA:key=data_version, value=oops] [DATA:key=digest_version, value=9] "
+            "[DATA:key=access_level, value=curator] [DATA:key=interview_completed, value=yes]"
+        )
+        self.assertEqual(TagWriter(user, profile).write(tags)['user_data'], [])
+
+        _, tags = extract_tags("[DATA:key=first_name, value=Ingrid] [DATA:key=last_name, value=Jonsdottir]")
+        self.assertEqual(TagWriter(user, profile).write(tags)['user_data'], [{'first_name': 'Ingrid'}, {'last_name': 'Jonsdottir'}])
+
+        profile.refresh_from_db()
+        self.assertEqual((profile.first_name, profile.last_name), ('Ingrid', 'Jonsdottir'))
+        self.assertEqual((profile.access_level, profile.interview_completed, profile.digest_version), ('contributor', False, None))
+
+
+class ParseRelationTests(SimpleTestCase):
+    def test_generations_and_side(self):
+        cases = {
+            'Self': (0, None),
+            'Mother': (1, 'maternal'),
+            'Paternal Grandmother': (2, 'paternal'),
+            'grandmother (maternal)': (2, 'maternal'),
+            'Great-Great-Grandmother': (4, None),
+            '2nd great grandfather': (4, None),
+            "father's mother": (2, 'paternal'),
+            "Mother's father's mother": (3, 'maternal'),
+        }
+        for relation, expected in cases.items():
+            with self.subTest(relation=relation):
+                self.assertEqual(parse_relation(relation), expected)
+
+    def test_relations_off_the_direct_line_are_unknown(self):
+        for relation in ('Uncle', 'Father-in-law', 'Godmother', "Father's Uncle", '', None):
+            with self.subTest(relation=relation):
+                self.assertEqual(parse_relation(relation), (None, None))
@@ -11,6 +11,8 @@ urlpatterns = [
 
     # Bulk Import (Ticket #156)
     path('upload-gedcom/', views.upload_gedcom, name='upload_gedcom'),
+    path('import/<int:batch_id>/', views.import_status, name='import_status'),
+    path('export-gedcom/', views.export_gedcom, name='export_gedcom'),
 
     # Locations — NEW (Ticket #161)
     # GET  /heritage/locations/?search=Gimli
@@ -28,6 +30,9 @@ urlpatterns = [
     path('ancestor/<str:ancestor_id>/facts/',               views.manage_ancestor_facts, name='manage_ancestor_facts'),
     path('ancestor/<str:ancestor_id>/facts/<int:fact_id>/', views.manage_single_fact,    name='manage_single_fact'),
 
+    # Lineage queries over the ancestry closure table
+    path('ancestor/<str:ancestor_id>/lineage/', views.ancestor_lineage, name='ancestor_lineage'),
+
     # Ancestor <-> Event linking — NEW (Ticket #161)
     path('ancestor/<str:ancestor_id>/events/', views.manage_ancestor_events, name='manage_ancestor_events'),
 
@@ -5,15 +5,19 @@ import traceback
 from datetime import datetime
 from difflib import SequenceMatcher
 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.storage import FileSystemStorage
+from django.core.files.storage import default_storage
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-from .models import Ancestor, AncestorFact, HeritageEvent, HeritageLocation, EventParticipation
+from .models import Ancestor, AncestorFact, AncestorRelationship, HeritageEvent, HeritageLocation, EventParticipation, ImportBatch
+from .services.closure import ancestors_of, common_ancestors, descendants_of, generation_distance
 from .services.db_storage import DatabaseStorageService
-from .services.gedcom_service import GedcomImportService
+from .services.gedcom_export import GedcomExportService
+from .signals import ancestors_changed
+from .tasks import import_gedcom_batch
 
 
 # ---------------------------------------------------------------------------
@@ -100,8 +104,12 @@ def get_family_tree(request):
         try:
             user = get_user_for_request(request)
             ancestors = Ancestor.objects.filter(user=user).prefetch_related('facts', 'media_tags__media')
+            relationships = AncestorRelationship.objects.filter(user=user).values_list(
+                'from_ancestor__unique_id', 'to_ancestor__unique_id', 'relationship_type'
+            )
             return JsonResponse({
                 'tree':            [_serialize_ancestor(a) for a in ancestors],
+                'relationships':   [{'from': a, 'to': b, 'type': kind} for a, b, kind in relationships],
                 'total_ancestors': ancestors.count(),
             }, status=200)
         except Exception as e:
@@ -173,23 +181,113 @@ def get_timeline_data(request):
 
 @csrf_exempt
 def upload_gedcom(request):
+    """
+    POST /heritage/upload-gedcom/
+
+    Stages the file and queues the import, returning the batch id straight
+    away. Poll /heritage/import/<batch_id>/ for progress.
+
+    Send mode=reimport (matches the latest import with the same filename) or
+    reimport_of=<batch_id> to update an earlier import in place instead of
+    adding a second copy of the tree.
+    """
     if request.method == 'POST' and request.FILES.get('file'):
         try:
             user = get_user_for_request(request)
             gedcom_file = request.FILES['file']
-            fs = FileSystemStorage()
-            filename = fs.save(gedcom_file.name, gedcom_file)
-            file_path = fs.path(filename)
-            importer = GedcomImportService(user)
-            batch = importer.process_gedcom_file(file_path, gedcom_file.name)
-            os.remove(file_path)
-            return JsonResponse({'success': True, 'message': f'Successfully processed {batch.filename}'}, status=200)
+
+            source_batch = None
+            if request.POST.get('reimport_of') or request.POST.get('mode') == 'reimport':
+                previous = ImportBatch.objects.filter(user=user, status='completed')
+                if request.POST.get('reimport_of'):
+                    previous = previous.filter(pk=request.POST['reimport_of'])
+                else:
+                    previous = previous.filter(filename=gedcom_file.name)
+                previous = previous.order_by('-id').first()
+                if previous is None:
+                    return JsonResponse({'error': 'No completed import to update'}, status=404)
+                source_batch = previous.source_batch or previous
+
+            staged_file = default_storage.save(f"gedcom_staging/{uuid.uuid4().hex}_{os.path.basename(gedcom_file.name)}", gedcom_file)
+            batch = ImportBatch.objects.create(user=user, filename=gedcom_file.name, status='queued', staged_file=staged_file, source_batch=source_batch)
+
+            try:
+                # No publish retries: with the broker down the upload fails fast instead of holding the worker
+                import_gedcom_batch.apply_async((batch.id,), retry=False)
+            except Exception as e:
+                print(f"Error queuing GEDCOM import task: {e}")
+                ImportBatch.objects.filter(pk=batch.id).update(
+                    status='failed', finished_at=timezone.now(), errors=[{'record': None, 'error': f'Could not queue the import: {e}'}], error_count=1
+                )
+                try:
+                    default_storage.delete(staged_file)
+                except Exception as e:
+                    print(f"Error deleting staged GEDCOM file {staged_file}: {e}")
+                return JsonResponse({'error': 'The import could not be queued, please try again later', 'batch_id': batch.id}, status=503)
+
+            return JsonResponse({
+                'success':  True,
+                'batch_id': batch.id,
+                'status':   batch.status,
+                'message':  f'Import of {batch.filename} started',
+            }, status=202)
         except Exception as e:
             traceback.print_exc()
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'No file uploaded'}, status=400)
 
 
+@csrf_exempt
+def export_gedcom(request):
+    """
+    GET /heritage/export-gedcom/
+
+    Streams the user's tree as a GEDCOM 5.5.1 file.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        user = get_user_for_request(request)
+        response = StreamingHttpResponse(GedcomExportService(user).stream(), content_type='text/x-gedcom; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{user.username}_family_tree.ged"'
+        return response
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+def import_status(request, batch_id):
+    """
+    GET /heritage/import/<batch_id>/
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    user = get_user_for_request(request)
+    try:
+        batch = ImportBatch.objects.get(pk=batch_id, user=user)
+    except ImportBatch.DoesNotExist:
+        return JsonResponse({'error': 'Import not found'}, status=404)
+
+    now = timezone.now()
+    return JsonResponse({
+        'batch_id':              batch.id,
+        'filename':              batch.filename,
+        'status':                batch.status,
+        'total_individuals':     batch.total_individuals,
+        'processed_individuals': batch.processed_individuals,
+        'error_count':           batch.error_count,
+        'errors':                batch.errors,
+        'eta_seconds':           batch.eta_seconds(now),
+        'source_batch':          batch.source_batch_id,
+        'created':               batch.created_count,
+        'updated':               batch.updated_count,
+        'deleted':               batch.deleted_count,
+        'started_at':            batch.started_at.isoformat() if batch.started_at else None,
+        'finished_at':           batch.finished_at.isoformat() if batch.finished_at else None,
+    }, status=200)
+
+
 # ---------------------------------------------------------------------------
 # Locations  (NEW)
 # ---------------------------------------------------------------------------
@@ -360,6 +458,7 @@ def create_ancestor(request):
                 event=evt, ancestor=ancestor, defaults={'role': 'Principal'}
             )
 
+        ancestors_changed.send(sender=Ancestor, user=user, ancestor_ids=[ancestor.id])
         return JsonResponse({
             'success':  True,
             'ancestor': _serialize_ancestor(
@@ -425,6 +524,7 @@ def manage_ancestor(request, ancestor_id):
                 ancestor.birth_location = _resolve_location(data['birth_location_name'])
 
             ancestor.save()
+            ancestors_changed.send(sender=Ancestor, user=user, ancestor_ids=[ancestor.id])
             return JsonResponse({
                 'success':  True,
                 'ancestor': _serialize_ancestor(
@@ -446,6 +546,45 @@ def manage_ancestor(request, ancestor_id):
 # Ancestor Facts  (NEW)
 # ---------------------------------------------------------------------------
 
+@csrf_exempt
+def ancestor_lineage(request, ancestor_id):
+    """
+    GET /heritage/ancestor/<id>/lineage/?depth=3&with=<other_id>
+    Ancestors and descendants from the closure table, optionally with the
+    common ancestors of and generation distance to another ancestor.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    user = get_user_for_request(request)
+    try:
+        ancestor = Ancestor.objects.get(user=user, unique_id=ancestor_id)
+        other = Ancestor.objects.get(user=user, unique_id=request.GET['with']) if request.GET.get('with') else None
+    except Ancestor.DoesNotExist:
+        return JsonResponse({'error': 'Ancestor not found'}, status=404)
+
+    try:
+        depth = int(request.GET['depth']) if request.GET.get('depth') else None
+        person = lambda a, d: {'id': a.unique_id, 'name': a.name, 'depth': d}
+        data = {
+            'id':          ancestor.unique_id,
+            'ancestors':   [person(row.ancestor, row.depth) for row in ancestors_of(ancestor.id, depth)],
+            'descendants': [person(row.descendant, row.depth) for row in descendants_of(ancestor.id, depth)],
+        }
+        if other:
+            data['with'] = other.unique_id
+            data['generation_distance'] = generation_distance(ancestor.id, other.id)
+            data['common_ancestors'] = [
+                {'id': a.unique_id, 'name': a.name, 'depth': d1, 'other_depth': d2}
+                for a, d1, d2 in common_ancestors(ancestor.id, other.id)
+            ]
+        return JsonResponse(data, status=200)
+    except ValueError:
+        return JsonResponse({'error': 'depth must be an integer'}, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @csrf_exempt
 def manage_ancestor_facts(request, ancestor_id):
     """